@@ -1,26 +1,55 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from urllib.parse import parse_qs
+from fastapi.responses import Response, StreamingResponse
+from urllib.parse import parse_qs, urlencode
+from contextlib import asynccontextmanager
 import asyncio
+import base64
 import os
 import sqlite3
+import time
 import uuid
+from datetime import date, timedelta
 import hashlib
 import json
+import httpx
 from typing import Optional, Dict, List
 
 # ── shared state (config, httpx client, DICOM helpers) ───────────────────────
 from app_state import (
-    DCM4CHEE_URL, DEFAULT_WEBAPP, client,
+    DCM4CHEE_URL, DEFAULT_WEBAPP, client, background_client,
     get_token, get_webapp_path, clean_query_params, _gv, _fmt_date,
-    _fetch_all_series, fetch_hospitals_cached,
+    fetch_hospitals_cached, cached_device_configs, store_device_config, device_cache_info, ae_owner,
+    refresh_device_configs, lookup_study_uids, fetch_studies_by_uid, study_trend, ROLLUP_PERIODS,
+    CRAWL_CONCURRENCY, CRAWL_PAGE_SIZE, token_manager, upstream_pool_info,
+    UPSTREAM_DEADLINE, QIDO_CACHE_MAX_BYTES, QIDO_CACHE_TTLS,
+    CURSOR_KEY_ATTR, CURSOR_KEY_TAG, CURSOR_MAX_PAGE_SIZE,
+    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_LEVELS,
+    DASHBOARD_REFRESH_INTERVAL, COUNT_CACHE_TTL, EVENTS_POLL_INTERVAL, EVENTS_HEARTBEAT,
 )
+from aggregate import BACKEND as AGGREGATE_BACKEND, aggregate_studies
+from fast_json import BACKEND as JSON_BACKEND, FastJSONResponse, FastJSONRoute, dumps, loads
+from compression import CompressionMiddleware, record_upstream, stats_dict as compression_metrics
+from crawler import crawl, crawl_pages, crawl_stats
+from qido_cache import Coalescer, ResponseCache, normalize_query
+from compact import FORMAT_PARAMS, CompactSpec, compact_spec
+from upstream import set_deadline, upstream_state
 
 # ── routers ───────────────────────────────────────────────────────────────────
 from routers.smart_search import router as smart_search_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background work that runs for the life of the app: the dashboard snapshot loop
+    # and the first device-config load.
+    _dashboard["loop"] = asyncio.create_task(_dashboard_loop())
+    refresh_device_configs()
+    yield
+    _dashboard["loop"].cancel()
+
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+app.router.route_class = FastJSONRoute  # before any route is declared
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,9 +58,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, levels=COMPRESSION_LEVELS)
 
 app.include_router(smart_search_router, prefix="/api")
 
+# Upstream time budget per endpoint (longest matching prefix wins, else UPSTREAM_DEADLINE).
+# Retries and attempt timeouts are cut to fit; past it the handler sees a 504.
+ENDPOINT_DEADLINES: Dict[str, float] = {
+    "/api/patients":          120.0,  # unbounded listing crawls every patient
+    "/api/hospitals":         120.0,  # first call waits for the institution crawl
+    "/api/dashboard/hospital": 60.0,
+    "/api/smart-search":       60.0,
+    "/api/export-tasks/csv":   60.0,
+}
+_DEADLINE_PREFIXES = sorted(ENDPOINT_DEADLINES.items(), key=lambda x: -len(x[0]))
+
+
+@app.middleware("http")
+async def upstream_deadline(request: Request, call_next):
+    path = request.url.path
+    set_deadline(next((s for p, s in _DEADLINE_PREFIXES if path.startswith(p)), UPSTREAM_DEADLINE))
+    return await call_next(request)
+
 # ============================================================================
 # HOSPITALS
 # ============================================================================
@@ -51,15 +100,262 @@ async def get_hospital(hospital_id: int):
     raise HTTPException(status_code=404, detail="Hospital not found")
 
 
+# ============================================================================
+# QIDO PROXY HELPERS
+# ============================================================================
+
+_qido_coalescer = Coalescer()
+_qido_cache     = ResponseCache(QIDO_CACHE_MAX_BYTES)
+
+
+async def _proxy_qido(webAppService: str, resource: str, query_params: str = "") -> Response:
+    """
+    GET a QIDO resource and pass its DICOM JSON body through undecoded ([] on 204).
+    Responses are cached per resource TTL (QIDO_CACHE_TTLS) and identical concurrent
+    misses share one upstream request. If dcm4chee is unavailable (503/504), the
+    last cached response is served even if it has expired.
+    """
+    key = (webAppService, resource, normalize_query(query_params))
+    hit, entry = _qido_cache.get(key)
+
+    async def _fetch():
+        token = await get_token()
+        url = f"{DCM4CHEE_URL}{get_webapp_path(webAppService)}/{resource}"
+        if query_params:
+            url += f"?{query_params}"
+        headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
+        response = await client.get(url, headers=headers)
+        record_upstream(response.num_bytes_downloaded, len(response.content))
+        if response.status_code == 204:
+            entry = (b"[]", "application/dicom+json")
+        elif response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        else:
+            entry = (response.content, response.headers.get("content-type", "application/dicom+json"))
+        ttl = QIDO_CACHE_TTLS.get(resource.split("/", 1)[0], 0)
+        _qido_cache.put(key, entry, len(entry[0]), ttl)
+        return entry
+
+    if not hit:
+        try:
+            entry = await _qido_coalescer.run(key, _fetch)
+        except HTTPException as e:
+            if e.status_code not in (503, 504):
+                raise
+            hit, entry = _qido_cache.get_stale(key)
+            if not hit:
+                raise
+    body, media_type = entry
+    return Response(content=body, media_type=media_type)
+
+
+def invalidate_qido_cache(webAppService: Optional[str] = None, resource: Optional[str] = None) -> int:
+    """Drop cached QIDO responses, optionally only for one webAppService and/or resource prefix."""
+    return _qido_cache.invalidate(lambda key: (
+        (webAppService is None or key[0] == webAppService)
+        and (resource is None or key[1].startswith(resource))
+    ))
+
+
+def _compact_request(request: Request, resource: str) -> Optional[CompactSpec]:
+    """CompactSpec for ?format=compact&fields=…&layout=…, None for plain DICOM JSON."""
+    qp = request.query_params
+    return compact_spec(resource, qp.get("format", ""), qp.get("fields", ""), qp.get("layout", ""))
+
+
+def _with_includefields(query_params: str, compact: Optional[CompactSpec]) -> str:
+    """Ask dcm4chee for every projected field, not just its default attribute set."""
+    if compact is None:
+        return query_params
+    extra = urlencode([("includefield", tag) for tag in compact.includefields()])
+    return f"{query_params}&{extra}" if query_params else extra
+
+
+def _shaped(response: Response, compact: Optional[CompactSpec]) -> Response:
+    """Pass a proxied QIDO body through, or project it when compact output was requested."""
+    if compact is None:
+        return response
+    return FastJSONResponse(compact.render(loads(response.body)))
+
+
+# ============================================================================
+# CURSOR PAGINATION
+# ============================================================================
+# A cursor is the base64url JSON state of a listing: resource (r), webAppService (w),
+# base query (q), page size (n) and rows served so far (p). Keyset cursors also carry
+# the order attribute (a), tag (g), direction (d), the last key value (k) and how many
+# served rows share it (t); the next page is "<a>=-<k>&orderby=-<a>&offset=<t>", so the
+# upstream offset never grows with depth. Resources without a keyset attribute, or
+# queries with their own orderby / filter on it, are paged by plain offset.
+
+CURSOR_KEYS: Dict[str, tuple] = {
+    "studies": (CURSOR_KEY_ATTR, CURSOR_KEY_TAG),
+    "series":  (CURSOR_KEY_ATTR, CURSOR_KEY_TAG),
+}
+CURSOR_PARAMS = ("pageSize", "cursor", "limit", "offset")
+
+_cursor_stats: Dict[str, int] = {"pages": 0, "keysetPages": 0, "prefetches": 0, "prefetchErrors": 0}
+_prefetch_tasks: set = set()
+
+
+def _encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, resource: str) -> dict:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(state, dict) or state.get("r") != resource:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return state
+
+
+def _first_cursor(
+    request: Request, webAppService: str, resource: str, page_size: int,
+    compact: Optional[CompactSpec],
+) -> dict:
+    if not 1 <= page_size <= CURSOR_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"pageSize must be 1..{CURSOR_MAX_PAGE_SIZE}")
+    query  = clean_query_params(str(request.url.query), drop=CURSOR_PARAMS + FORMAT_PARAMS)
+    params = parse_qs(_with_includefields(query, compact))
+    state  = {"r": resource, "w": webAppService, "n": page_size, "p": 0}
+    attr, tag = CURSOR_KEYS.get(resource, (None, None))
+    order  = params.get("orderby", [f"-{attr}"])
+    if attr and attr not in params and order in ([attr], [f"-{attr}"]):
+        params.pop("orderby", None)
+        state.update(a=attr, g=tag, d=order[0].startswith("-"), k=None, t=0)
+    state["q"] = urlencode(params, doseq=True)
+    return state
+
+
+def _cursor_query(state: dict) -> str:
+    """Upstream query string for the page a cursor state points at."""
+    extra = [("limit", state["n"])]
+    if "a" in state:
+        attr  = state["a"]
+        extra += [("includefield", attr), ("orderby", f"-{attr}" if state["d"] else attr)]
+        if state["k"]:
+            extra.append((attr, f"-{state['k']}" if state["d"] else f"{state['k']}-"))
+        extra.append(("offset", state["t"]))
+    else:
+        extra.append(("offset", state["p"]))
+    return "&".join(p for p in (state["q"], urlencode(extra)) if p)
+
+
+def _next_cursor(state: dict, rows: list) -> Optional[dict]:
+    if len(rows) < state["n"]:
+        return None
+    nxt = {**state, "p": state["p"] + len(rows)}
+    if "a" not in state:
+        return nxt
+    last = _gv(rows[-1], state["g"])
+    if not last:
+        # Key not returned (e.g. CURSOR_KEY_TAG does not match): keep the same order,
+        # continue by absolute offset.
+        order = f"-{state['a']}" if state["d"] else state["a"]
+        nxt["q"] = "&".join(p for p in (state["q"], urlencode({"orderby": order})) if p)
+        for k in ("a", "g", "d", "k", "t"):
+            nxt.pop(k)
+        return nxt
+    ties = sum(1 for row in rows if _gv(row, state["g"]) == last)
+    nxt.update(k=last, t=ties + (state["t"] if last == state["k"] else 0))
+    return nxt
+
+
+async def _prefetch(webAppService: str, resource: str, query: str) -> None:
+    """Warm the QIDO cache with the page a client will most likely ask for next."""
+    _cursor_stats["prefetches"] += 1
+    try:
+        await _proxy_qido(webAppService, resource, query)
+    except Exception as e:
+        _cursor_stats["prefetchErrors"] += 1
+        print(f"[cursor] Prefetch of {resource} failed: {e}")
+
+
+async def _cursor_page(
+    request: Request, webAppService: str, resource: str,
+    page_size: Optional[int], cursor: Optional[str],
+) -> Response:
+    """
+    One cursor page as {"items": [...], "nextCursor": str | null}, prefetching the next one.
+    format=compact projects the items; pass the same fields on every page, since the
+    includefields sent to dcm4chee are fixed by the first one.
+    """
+    compact = _compact_request(request, resource)
+    if cursor:
+        state = _decode_cursor(cursor, resource)
+    else:
+        state = _first_cursor(request, webAppService, resource, page_size, compact)
+    page = await _proxy_qido(state["w"], resource, _cursor_query(state))
+    rows = loads(page.body)
+    nxt  = _next_cursor(state, rows)
+    _cursor_stats["pages"] += 1
+    _cursor_stats["keysetPages"] += "a" in state
+    if nxt is not None and QIDO_CACHE_TTLS.get(resource, 0) > 0:
+        task = asyncio.ensure_future(_prefetch(state["w"], resource, _cursor_query(nxt)))
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+    # Splice the upstream bytes into the envelope instead of re-encoding the rows.
+    items = page.body if compact is None else dumps(compact.render(rows))
+    body  = (b'{"items":' + items + b',"nextCursor":'
+            + dumps(_encode_cursor(nxt) if nxt else None) + b"}")
+    return Response(content=body, media_type="application/json")
+
+
 # ============================================================================
 # PATIENTS
 # ============================================================================
 
+# Streamed output formats for the unbounded patient listing (?stream=… or Accept).
+PATIENT_STREAM_TYPES = {"ndjson": "application/x-ndjson", "array": "application/json"}
+
+
+async def _stream_pages(pages, first: list, fmt: str, project=None):
+    """
+    Encode crawl pages as they arrive; the crawl only fetches ahead while the client reads.
+    project, if given, maps each row first (compact output).
+    """
+    try:
+        if fmt == "ndjson":
+            page = first
+            while True:
+                if page:
+                    yield b"".join(dumps(project(row) if project else row) + b"\n" for row in page)
+                page = await pages.__anext__()
+        else:
+            yield b"["
+            sep, page = b"", first
+            while True:
+                if page:
+                    yield sep + b",".join(dumps(project(row) if project else row) for row in page)
+                    sep = b","
+                page = await pages.__anext__()
+    except StopAsyncIteration:
+        if fmt == "array":
+            yield b"]"
+    except Exception as e:
+        # Headers are already sent: log it and cut the stream so the client sees it truncated.
+        print(f"[patients] Stream aborted: {e}")
+        raise
+    finally:
+        await pages.aclose()
+
+
 @app.get("/api/patients")
-async def search_patients(request: Request, webAppService: str = DEFAULT_WEBAPP):
+async def search_patients(
+    request: Request, webAppService: str = DEFAULT_WEBAPP, stream: str = "",
+    pageSize: Optional[int] = None, cursor: Optional[str] = None,
+):
     try:
+        if pageSize or cursor:
+            return await _cursor_page(request, webAppService, "patients", pageSize, cursor)
+        compact = _compact_request(request, "patients")
         token = await get_token()
-        query_params = clean_query_params(str(request.url.query))
+        query_params = clean_query_params(str(request.url.query), drop=("stream",) + FORMAT_PARAMS)
+        query_params = _with_includefields(query_params, compact)
         dcm_path = get_webapp_path(webAppService)
         headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
 
@@ -71,29 +367,45 @@ async def search_patients(request: Request, webAppService: str = DEFAULT_WEBAPP)
                 url += f"?{query_params}"
             response = await client.get(url, headers=headers)
             if response.status_code == 204:
-                return []
-            if response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            return response.json()
-
-        # No limit specified — paginate to retrieve all patients
-        base_params = f"?{query_params}&" if query_params else "?"
-        page_size = 1000
-        all_patients: list = []
-        offset = 0
-        while True:
-            url = f"{DCM4CHEE_URL}{dcm_path}/patients{base_params}limit={page_size}&offset={offset}"
-            response = await client.get(url, headers=headers)
-            if response.status_code == 204:
-                break
+                return compact.render([]) if compact else []
             if response.status_code != 200:
                 raise HTTPException(status_code=response.status_code, detail=response.text)
-            page = response.json() or []
-            all_patients.extend(page)
-            if len(page) < page_size:
-                break
-            offset += page_size
-        return all_patients
+            return compact.render(response.json()) if compact else response.json()
+
+        # No limit specified — crawl all patients. Patients carry no receive time,
+        # so this is a single window paged CRAWL_CONCURRENCY pages at a time.
+        if not stream and "application/x-ndjson" in request.headers.get("accept", ""):
+            stream = "ndjson"
+        if not stream:
+            rows = await crawl(
+                client, f"{DCM4CHEE_URL}{dcm_path}/patients", headers, query_params,
+                name="patients", page_size=CRAWL_PAGE_SIZE, concurrency=CRAWL_CONCURRENCY,
+            )
+            return compact.render(rows) if compact else rows
+        if stream not in PATIENT_STREAM_TYPES:
+            raise HTTPException(status_code=400, detail=f"stream must be one of {sorted(PATIENT_STREAM_TYPES)}")
+        if compact and compact.layout == "columns":
+            raise HTTPException(status_code=400, detail="layout=columns cannot be streamed")
+
+        # A stream is paced by the client, so drop the request deadline; per-attempt
+        # timeouts still apply. The first page is awaited here so upstream errors
+        # before any output still map to an HTTP status.
+        set_deadline(None)
+        pages = crawl_pages(
+            client, f"{DCM4CHEE_URL}{dcm_path}/patients", headers, query_params,
+            name="patients", page_size=CRAWL_PAGE_SIZE, concurrency=CRAWL_CONCURRENCY,
+        )
+        try:
+            first = await pages.__anext__()
+        except StopAsyncIteration:
+            first = []
+        except BaseException:
+            await pages.aclose()
+            raise
+        return StreamingResponse(
+            _stream_pages(pages, first, stream, compact.row if compact else None),
+            media_type=PATIENT_STREAM_TYPES[stream],
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -103,16 +415,7 @@ async def search_patients(request: Request, webAppService: str = DEFAULT_WEBAPP)
 @app.get("/api/patients/{patient_id}/studies")
 async def get_patient_studies(patient_id: str, webAppService: str = DEFAULT_WEBAPP):
     try:
-        token = await get_token()
-        dcm_path = get_webapp_path(webAppService)
-        url = f"{DCM4CHEE_URL}{dcm_path}/patients/{patient_id}/studies"
-        headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
-        response = await client.get(url, headers=headers)
-        if response.status_code == 204:
-            return []
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-        return response.json()
+        return await _proxy_qido(webAppService, f"patients/{patient_id}/studies")
     except HTTPException:
         raise
     except Exception as e:
@@ -124,21 +427,16 @@ async def get_patient_studies(patient_id: str, webAppService: str = DEFAULT_WEBA
 # ============================================================================
 
 @app.get("/api/studies")
-async def search_studies(request: Request, webAppService: str = DEFAULT_WEBAPP):
+async def search_studies(
+    request: Request, webAppService: str = DEFAULT_WEBAPP,
+    pageSize: Optional[int] = None, cursor: Optional[str] = None,
+):
     try:
-        token = await get_token()
-        query_params = clean_query_params(str(request.url.query))
-        dcm_path = get_webapp_path(webAppService)
-        url = f"{DCM4CHEE_URL}{dcm_path}/studies"
-        if query_params:
-            url += f"?{query_params}"
-        headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
-        response = await client.get(url, headers=headers)
-        if response.status_code == 204:
-            return []
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-        return response.json()
+        if pageSize or cursor:
+            return await _cursor_page(request, webAppService, "studies", pageSize, cursor)
+        compact = _compact_request(request, "studies")
+        query_params = clean_query_params(str(request.url.query), drop=FORMAT_PARAMS)
+        return _shaped(await _proxy_qido(webAppService, "studies", _with_includefields(query_params, compact)), compact)
     except HTTPException:
         raise
     except Exception as e:
@@ -152,19 +450,9 @@ async def search_studies(request: Request, webAppService: str = DEFAULT_WEBAPP):
 @app.get("/api/mwl")
 async def search_mwl(request: Request, webAppService: str = DEFAULT_WEBAPP):
     try:
-        token = await get_token()
-        query_params = clean_query_params(str(request.url.query))
-        dcm_path = get_webapp_path(webAppService)
-        url = f"{DCM4CHEE_URL}{dcm_path}/mwlitems"
-        if query_params:
-            url += f"?{query_params}"
-        headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
-        response = await client.get(url, headers=headers)
-        if response.status_code == 204:
-            return []
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-        return response.json()
+        compact = _compact_request(request, "mwlitems")
+        query_params = clean_query_params(str(request.url.query), drop=FORMAT_PARAMS)
+        return _shaped(await _proxy_qido(webAppService, "mwlitems", _with_includefields(query_params, compact)), compact)
     except HTTPException:
         raise
     except Exception as e:
@@ -203,37 +491,16 @@ def _transform_study_for_dashboard(study: dict, idx: int) -> dict:
 
 
 async def _aggregate_stats(studies_raw: list, total_patients: int, hospital_id: Optional[str] = None) -> dict:
-    modality_counts: Dict[str, int] = {}
-    date_counts:     Dict[str, int] = {}
-    total_series    = 0
-    total_instances = 0
-
-    for study in studies_raw:
-        for m in study.get("00080061", {}).get("Value", []):
-            if m:
-                modality_counts[m] = modality_counts.get(m, 0) + 1
-        fmt = _fmt_date(_gv(study, "00080020"))
-        if fmt:
-            date_counts[fmt] = date_counts.get(fmt, 0) + 1
-        try:
-            total_series    += int(study.get("numberOfStudyRelatedSeries")    or _gv(study, "00201206") or 0)
-            total_instances += int(study.get("numberOfStudyRelatedInstances") or _gv(study, "00201208") or 0)
-        except (ValueError, TypeError):
-            pass
-
+    # Columnar decode + vectorized histograms/totals (aggregate.py); only the ten
+    # recent studies are transformed row by row.
+    stats  = aggregate_studies(studies_raw)
     result = {
-        "totalStudies":      len(studies_raw),
+        "totalStudies":      stats["totalStudies"],
         "totalPatients":     total_patients,
-        "totalSeries":       total_series,
-        "totalInstances":    total_instances,
-        "studiesByModality": sorted(
-            [{"modality": k, "count": v} for k, v in modality_counts.items()],
-            key=lambda x: -x["count"],
-        ),
-        "studiesByDate": [
-            {"date": d, "count": c}
-            for d, c in sorted(date_counts.items())[-30:]
-        ],
+        "totalSeries":       stats["totalSeries"],
+        "totalInstances":    stats["totalInstances"],
+        "studiesByModality": stats["studiesByModality"],
+        "studiesByDate":     stats["studiesByDate"],
         "recentStudies": [
             _transform_study_for_dashboard(s, i)
             for i, s in enumerate(studies_raw[:10])
@@ -245,30 +512,176 @@ async def _aggregate_stats(studies_raw: list, total_patients: int, hospital_id:
 
 
 
-@app.get("/api/dashboard")
-async def get_dashboard_stats():
-    """Network-wide aggregated dashboard statistics."""
-    try:
-        token    = await get_token()
-        headers  = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
-        dcm_path = get_webapp_path(DEFAULT_WEBAPP)
+# Archive totals: dcm4chee answers GET …/{resource}/count with {"count": n} from its
+# database, so true totals cost a handful of cheap queries instead of a crawl.
+COUNT_RESOURCES = ("patients", "studies", "series", "instances")
+_count_cache    = ResponseCache(1024 * 1024)
 
-        # Fetch recent studies for modality breakdown, series/instance counts, recent-studies widget
-        recent_resp = await client.get(
-            f"{DCM4CHEE_URL}{dcm_path}/studies?limit=200&orderby=-StudyDate"
-            "&includefield=00080061,00100020,00080020,00081030,00080050,00201206,00201208",
-            headers=headers,
+
+async def _qido_count(resource: str, query_params: str = "") -> int:
+    key = ("count", resource, normalize_query(query_params))
+    hit, count = _count_cache.get(key)
+    if hit:
+        return count
+
+    async def _fetch():
+        token = await get_token()
+        url = f"{DCM4CHEE_URL}{get_webapp_path(DEFAULT_WEBAPP)}/{resource}/count"
+        if query_params:
+            url += f"?{query_params}"
+        # Only the background dashboard rebuild asks for counts.
+        response = await background_client.get(
+            url, headers={"Accept": "application/json", "Authorization": f"Bearer {token}"},
         )
-        recent_raw: list = []
-        if recent_resp.status_code == 200:
-            recent_raw = recent_resp.json() or []
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        count = int(response.json()["count"])
+        _count_cache.put(key, count, len(response.content), COUNT_CACHE_TTL)
+        return count
 
-        # Count unique patients in recent studies as a quick proxy
-        total_patients = len({_gv(s, "00100020") for s in recent_raw if _gv(s, "00100020")})
+    return await _qido_coalescer.run(key, _fetch)
 
-        stats = await _aggregate_stats(recent_raw, total_patients)
-        return stats
 
+async def _archive_totals(modalities: List[str]) -> dict:
+    """
+    Archive-wide counts per resource and studies per modality, queried concurrently.
+    A failed count is left out, so callers can keep their sampled value.
+    """
+    results = await asyncio.gather(
+        *[_qido_count(r) for r in COUNT_RESOURCES],
+        *[_qido_count("studies", urlencode({"ModalitiesInStudy": m})) for m in modalities],
+        return_exceptions=True,
+    )
+    for r in results:
+        if isinstance(r, Exception):
+            print(f"[dashboard] Count query failed: {r}")
+    n = len(COUNT_RESOURCES)
+    return {
+        "resources":  {res: c for res, c in zip(COUNT_RESOURCES, results[:n]) if isinstance(c, int)},
+        "modalities": {m: c for m, c in zip(modalities, results[n:]) if isinstance(c, int)},
+    }
+
+
+async def _compute_network_dashboard() -> dict:
+    """Network-wide aggregated dashboard statistics, straight from dcm4chee."""
+    token    = await get_token()
+    headers  = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
+    dcm_path = get_webapp_path(DEFAULT_WEBAPP)
+
+    # Fetch recent studies for modality breakdown, series/instance counts, recent-studies widget.
+    # Rebuilds run in the background (see _dashboard_loop), so they use the background lane.
+    recent_resp = await background_client.get(
+        f"{DCM4CHEE_URL}{dcm_path}/studies?limit=200&orderby=-StudyDate"
+        "&includefield=00080061,00100020,00080020,00081030,00080050,00201206,00201208",
+        headers=headers,
+    )
+    if recent_resp.status_code not in (200, 204):
+        raise HTTPException(status_code=recent_resp.status_code, detail=recent_resp.text)
+    recent_raw: list = recent_resp.json() if recent_resp.status_code == 200 else []
+
+    # Count unique patients in recent studies as a quick proxy
+    total_patients = len({_gv(s, "00100020") for s in recent_raw if _gv(s, "00100020")})
+
+    stats = await _aggregate_stats(recent_raw, total_patients)
+    stats["sampleSize"] = len(recent_raw)
+
+    # Replace the sampled totals with archive-wide counts where dcm4chee answers them.
+    archive_modalities = [m for m in await _fetch_modalities(background_client) if isinstance(m, str)]
+    modalities = sorted({m["modality"] for m in stats["studiesByModality"]} | set(archive_modalities))
+    totals = await _archive_totals(modalities)
+    for res, field in (("patients", "totalPatients"), ("studies", "totalStudies"),
+                       ("series", "totalSeries"), ("instances", "totalInstances")):
+        if res in totals["resources"]:
+            stats[field] = totals["resources"][res]
+    if totals["modalities"]:
+        stats["studiesByModality"] = sorted(
+            [{"modality": m, "count": c} for m, c in totals["modalities"].items() if c],
+            key=lambda x: -x["count"],
+        )
+    return stats
+
+
+# Materialized network dashboard: rendered body + weak ETag over the stats (not the
+# timestamp), rebuilt every DASHBOARD_REFRESH_INTERVAL seconds by _dashboard_loop.
+_dashboard: Dict = {"body": None, "etag": None, "generatedAt": None, "refreshing": None, "loop": None}
+
+
+async def _materialize_dashboard() -> None:
+    stats = await _compute_network_dashboard()
+    generated_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    _dashboard["etag"]        = f'W/"{hashlib.blake2b(dumps(stats), digest_size=8).hexdigest()}"'
+    _dashboard["body"]        = dumps({**stats, "generatedAt": generated_at})
+    _dashboard["generatedAt"] = generated_at
+    wake_live_events()
+
+
+def _refresh_dashboard() -> "asyncio.Future":
+    """Start a rebuild unless one is running; callers share it."""
+    task = _dashboard["refreshing"]
+    if task is None or task.done():
+        task = _dashboard["refreshing"] = asyncio.ensure_future(_materialize_dashboard())
+    # shield: a cancelled caller must not cancel the rebuild the others are awaiting
+    return asyncio.shield(task)
+
+
+async def _dashboard_loop() -> None:
+    set_deadline(None)
+    while True:
+        try:
+            await _refresh_dashboard()
+        except Exception as e:
+            print(f"[dashboard] Refresh failed, serving previous snapshot: {e}")
+        await asyncio.sleep(DASHBOARD_REFRESH_INTERVAL)
+
+
+def _trend_range(granularity: Optional[str], start: Optional[str], end: Optional[str]) -> Optional[tuple]:
+    """(granularity, from, to) for the trend params, None if no trend was asked for; 400 on bad input."""
+    if not (granularity or start or end):
+        return None
+    granularity = granularity or "month"
+    if granularity not in ROLLUP_PERIODS:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(ROLLUP_PERIODS)}")
+    try:
+        end_d   = date.fromisoformat(end) if end else date.today()
+        start_d = date.fromisoformat(start) if start else (end_d - timedelta(days=365)).replace(day=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from/to must be YYYY-MM-DD dates")
+    if start_d > end_d:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    return granularity, start_d.isoformat(), end_d.isoformat()
+
+
+@app.get("/api/dashboard")
+async def get_dashboard_stats(
+    request: Request, granularity: Optional[str] = None,
+    start: Optional[str] = Query(None, alias="from"), end: Optional[str] = Query(None, alias="to"),
+):
+    """
+    Network-wide aggregated dashboard statistics, served from the background snapshot.
+    granularity=day|week|month and/or from/to (YYYY-MM-DD) add a "trend" from the rollup store.
+    """
+    try:
+        trend = _trend_range(granularity, start, end)
+        if _dashboard["body"] is None:
+            await _refresh_dashboard()  # cold start: the first snapshot is not ready yet
+        if trend:
+            return {**loads(_dashboard["body"]), "trend": await study_trend(*trend)}
+        headers = {"ETag": _dashboard["etag"], "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == _dashboard["etag"]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=_dashboard["body"], media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/dashboard/refresh")
+async def refresh_dashboard():
+    """Rebuild the network dashboard now instead of waiting for the next interval."""
+    try:
+        await _refresh_dashboard()
+        return {"generatedAt": _dashboard["generatedAt"], "etag": _dashboard["etag"]}
     except HTTPException:
         raise
     except Exception as e:
@@ -276,12 +689,18 @@ async def get_dashboard_stats():
 
 
 @app.get("/api/dashboard/hospital/{hospital_id}")
-async def get_hospital_dashboard(hospital_id: str):
+async def get_hospital_dashboard(
+    hospital_id: str, granularity: Optional[str] = None,
+    start: Optional[str] = Query(None, alias="from"), end: Optional[str] = Query(None, alias="to"),
+):
     """
     Per-hospital dashboard.
-    Loads all studies, groups by InstitutionName, then filters to just this hospital.
+    Filters studies by InstitutionName upstream, falling back to the local
+    study→institution index when the study-level attribute is not set.
+    granularity / from / to add the hospital's "trend" from the rollup store.
     """
     try:
+        trend = _trend_range(granularity, start, end)
         token    = await get_token()
         headers  = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
         dcm_path = get_webapp_path(DEFAULT_WEBAPP)
@@ -311,35 +730,24 @@ async def get_hospital_dashboard(hospital_id: str):
         if studies_resp.status_code == 200:
             studies_raw = studies_resp.json() or []
 
-        # If the server-side filter returned nothing, fall back:
-        # fetch all studies and filter client-side using series InstitutionName map
+        # If the server-side filter returned nothing (InstitutionName is often only
+        # on series), look the study UIDs up in the local study→institution index
+        # and fetch exactly those studies.
         if not studies_raw and institution_name and institution_name != "Unknown":
-            all_studies_resp = await client.get(
-                f"{DCM4CHEE_URL}{dcm_path}/studies?limit=2000&orderby=-StudyDate"
-                "&includefield=00080080,00080061,00100020,00080020,00081030,00080050,00201206,00201208",
-                headers=headers,
+            uids = await lookup_study_uids(institution_name, limit=2000)
+            studies_raw = await fetch_studies_by_uid(
+                token, dcm_path, uids,
+                "00080080,00080061,00100020,00080020,00081030,00080050,00201206,00201208",
             )
-            all_studies = all_studies_resp.json() if all_studies_resp.status_code == 200 else []
-            series_list = await _fetch_all_series(token, dcm_path)
-            uid_to_inst = {
-                _gv(s, "0020000D"): _gv(s, "00080080") or ""
-                for s in series_list
-                if _gv(s, "0020000D")
-            }
-
-            studies_raw = [
-                s for s in all_studies
-                if (
-                    uid_to_inst.get(_gv(s, "0020000D"), "").lower() == institution_name.lower()
-                    or (_gv(s, "00080080") or "").lower() == institution_name.lower()
-                )
-            ]
 
         # Count unique patients in this institution's studies
         patient_ids = {_gv(s, "00100020") for s in studies_raw if _gv(s, "00100020")}
         total_patients = len(patient_ids)
 
-        return await _aggregate_stats(studies_raw, total_patients, hospital_id=hospital_id)
+        stats = await _aggregate_stats(studies_raw, total_patients, hospital_id=hospital_id)
+        if trend:
+            stats["trend"] = await study_trend(*trend, institution=institution_name or "")
+        return stats
 
     except HTTPException:
         raise
@@ -352,21 +760,16 @@ async def get_hospital_dashboard(hospital_id: str):
 # ============================================================================
 
 @app.get("/api/series")
-async def search_series(request: Request, webAppService: str = DEFAULT_WEBAPP):
+async def search_series(
+    request: Request, webAppService: str = DEFAULT_WEBAPP,
+    pageSize: Optional[int] = None, cursor: Optional[str] = None,
+):
     try:
-        token = await get_token()
-        query_params = clean_query_params(str(request.url.query))
-        dcm_path = get_webapp_path(webAppService)
-        url = f"{DCM4CHEE_URL}{dcm_path}/series"
-        if query_params:
-            url += f"?{query_params}"
-        headers = {"Accept": "application/dicom+json", "Authorization": f"Bearer {token}"}
-        response = await client.get(url, headers=headers)
-        if response.status_code == 204:
-            return []
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-        return response.json()
+        if pageSize or cursor:
+            return await _cursor_page(request, webAppService, "series", pageSize, cursor)
+        compact = _compact_request(request, "series")
+        query_params = clean_query_params(str(request.url.query), drop=FORMAT_PARAMS)
+        return _shaped(await _proxy_qido(webAppService, "series", _with_includefields(query_params, compact)), compact)
     except HTTPException:
         raise
     except Exception as e:
@@ -414,25 +817,62 @@ async def get_device(device_name: str):
 # ============================================================================
 
 async def _get_device_config(token: str, device_name: str) -> dict:
+    """
+    Current config straight from dcm4chee, for edits; listings read cached_device_configs().
+    Raises unless it was read, so an edit never PUTs a stub over the whole device.
+    """
     headers = {"Authorization": f"Bearer {token}"}
     resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{device_name}", headers=headers)
-    return resp.json() if resp.status_code == 200 else {}
+    if resp.status_code != 200:
+        # 5xx here includes the transport's own 503 (circuit open) and 504 (deadline).
+        raise HTTPException(
+            status_code=resp.status_code if 400 <= resp.status_code < 500 else 502,
+            detail=f"Could not read device '{device_name}': {resp.text}",
+        )
+    return resp.json()
 
 
-async def _find_ae_in_devices(token: str, local_ae: str, device_names: list):
-    """Return (device_name, config, ae_index) for the device that owns local_ae."""
-    headers = {"Authorization": f"Bearer {token}"}
-    for name in device_names:
-        config = await _get_device_config(token, name)
-        for idx, ae in enumerate(config.get("dicomNetworkAE", [])):
-            if ae.get("dicomAETitle") == local_ae:
-                return name, config, idx
-    # Fallback: first device, first AE
-    if device_names:
-        config = await _get_device_config(token, device_names[0])
+async def _put_device_config(token: str, device_name: str, config: dict) -> None:
+    """PUT a device config and write it through to the device-config cache."""
+    put = await client.put(
+        f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{device_name}",
+        json=config,
+        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+    )
+    if put.status_code not in (200, 204):
+        raise HTTPException(status_code=put.status_code, detail=put.text)
+    store_device_config(device_name, config)
+
+
+async def _resolve_ae_owner(token: str, local_ae: str, fallback_device: Optional[str] = None):
+    """
+    Return (device_name, config, ae_index, fallback) for the device that owns local_ae,
+    with that device's current config. The owner comes from the AE-title index; on a
+    miss the device configs are refreshed and the index consulted once more. If no
+    device has the AE, the first AE of fallback_device is used when the caller named
+    one (fallback=True), else (None, None, None, False). A device config that cannot
+    be read raises (see _get_device_config) rather than counting as a miss.
+    """
+    for attempt in range(2):
+        owner = await ae_owner(local_ae)
+        if owner is not None:
+            name, idx = owner
+            config = await _get_device_config(token, name)
+            aes = config.get("dicomNetworkAE", [])
+            if idx >= len(aes) or aes[idx].get("dicomAETitle") != local_ae:
+                # The device changed since the index was built: find the AE in the current config.
+                idx = next((i for i, ae in enumerate(aes) if ae.get("dicomAETitle") == local_ae), None)
+            if idx is not None:
+                return name, config, idx, False
+        if attempt == 0:
+            # Added or moved since the last refresh: reload the configs and look again.
+            await refresh_device_configs()
+    if fallback_device:
+        config = await _get_device_config(token, fallback_device)
         if config.get("dicomNetworkAE"):
-            return device_names[0], config, 0
-    return None, None, None
+            print(f"[devices] AE '{local_ae}' not found, using the first AE of '{fallback_device}' as requested")
+            return fallback_device, config, 0, True
+    return None, None, None, False
 
 
 @app.post("/api/routing-rules")
@@ -441,18 +881,9 @@ async def create_routing_rule(request: Request):
     try:
         body = await request.json()
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        devices_resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers=headers)
-        if devices_resp.status_code != 200:
-            raise HTTPException(status_code=500, detail="Could not fetch devices")
-        device_names = [
-            d["dicomDeviceName"] if isinstance(d, dict) else d
-            for d in (devices_resp.json() or [])
-        ]
 
         local_ae = body.get("localAETitle", DEFAULT_WEBAPP)
-        dev_name, config, ae_idx = await _find_ae_in_devices(token, local_ae, device_names)
+        dev_name, config, ae_idx, fallback = await _resolve_ae_owner(token, local_ae, body.get("deviceName"))
         if dev_name is None:
             raise HTTPException(status_code=404, detail=f"AE '{local_ae}' not found in any device")
 
@@ -485,15 +916,9 @@ async def create_routing_rule(request: Request):
 
         existing.append(new_rule)
 
-        put_resp = await client.put(
-            f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{dev_name}",
-            json=config,
-            headers={**headers, "Content-Type": "application/json"},
-        )
-        if put_resp.status_code not in (200, 204):
-            raise HTTPException(status_code=put_resp.status_code, detail=put_resp.text)
+        await _put_device_config(token, dev_name, config)
 
-        return {"success": True, "cn": rule_cn, "localAETitle": local_ae, "device": dev_name}
+        return {"success": True, "cn": rule_cn, "localAETitle": local_ae, "device": dev_name, "fallback": fallback}
     except HTTPException:
         raise
     except Exception as e:
@@ -506,18 +931,9 @@ async def create_transform_rule(request: Request):
     try:
         body = await request.json()
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        devices_resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers=headers)
-        if devices_resp.status_code != 200:
-            raise HTTPException(status_code=500, detail="Could not fetch devices")
-        device_names = [
-            d["dicomDeviceName"] if isinstance(d, dict) else d
-            for d in (devices_resp.json() or [])
-        ]
 
         local_ae = body.get("localAETitle", DEFAULT_WEBAPP)
-        dev_name, config, ae_idx = await _find_ae_in_devices(token, local_ae, device_names)
+        dev_name, config, ae_idx, fallback = await _resolve_ae_owner(token, local_ae, body.get("deviceName"))
         if dev_name is None:
             raise HTTPException(status_code=404, detail=f"AE '{local_ae}' not found in any device")
 
@@ -545,15 +961,9 @@ async def create_transform_rule(request: Request):
 
         existing.append(new_rule)
 
-        put_resp = await client.put(
-            f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{dev_name}",
-            json=config,
-            headers={**headers, "Content-Type": "application/json"},
-        )
-        if put_resp.status_code not in (200, 204):
-            raise HTTPException(status_code=put_resp.status_code, detail=put_resp.text)
+        await _put_device_config(token, dev_name, config)
 
-        return {"success": True, "cn": rule_cn, "localAETitle": local_ae, "device": dev_name}
+        return {"success": True, "cn": rule_cn, "localAETitle": local_ae, "device": dev_name, "fallback": fallback}
     except HTTPException:
         raise
     except Exception as e:
@@ -563,18 +973,8 @@ async def create_transform_rule(request: Request):
 @app.get("/api/routing-rules")
 async def list_routing_rules():
     try:
-        token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        devices_resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers=headers)
-        if devices_resp.status_code != 200:
-            return []
-        device_names = [
-            d["dicomDeviceName"] if isinstance(d, dict) else d
-            for d in (devices_resp.json() or [])
-        ]
         rules = []
-        for name in device_names:
-            config = await _get_device_config(token, name)
+        for name, config in await cached_device_configs():
             for ae in config.get("dicomNetworkAE", []):
                 local_ae = ae.get("dicomAETitle", "")
                 for rule in ae.get("dcmNetworkAE", {}).get("dcmForwardRule", []):
@@ -599,18 +999,8 @@ async def list_routing_rules():
 @app.get("/api/transform-rules")
 async def list_transform_rules():
     try:
-        token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        devices_resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers=headers)
-        if devices_resp.status_code != 200:
-            return []
-        device_names = [
-            d["dicomDeviceName"] if isinstance(d, dict) else d
-            for d in (devices_resp.json() or [])
-        ]
         rules = []
-        for name in device_names:
-            config = await _get_device_config(token, name)
+        for name, config in await cached_device_configs():
             for ae in config.get("dicomNetworkAE", []):
                 local_ae = ae.get("dicomAETitle", "")
                 for rule in ae.get("dcmNetworkAE", {}).get("dcmCoercionRule", []):
@@ -723,11 +1113,10 @@ async def get_hl7_application(hl7_app_name: str):
 # MODALITIES
 # ============================================================================
 
-@app.get("/api/modalities")
-async def list_modalities():
+async def _fetch_modalities(http: httpx.AsyncClient) -> list:
     try:
         token = await get_token()
-        response = await client.get(
+        response = await http.get(
             f"{DCM4CHEE_URL}/dcm4chee-arc/modalities",
             headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
         )
@@ -739,6 +1128,11 @@ async def list_modalities():
         return []
 
 
+@app.get("/api/modalities")
+async def list_modalities():
+    return await _fetch_modalities(client)
+
+
 # ============================================================================
 # DEBUG
 # ============================================================================
@@ -784,42 +1178,60 @@ async def debug_institutions():
         return {"error": str(e)}
 
 
+@app.get("/api/debug/metrics")
+async def debug_metrics():
+    """Internal performance counters (crawl throughput, token refreshes, upstream lanes/breakers)."""
+    return {
+        "crawls":   crawl_stats,
+        "token":    token_manager.as_dict(),
+        "upstream": {**upstream_pool_info(), **upstream_state()},
+        "qido":     {
+            "coalescing": _qido_coalescer.as_dict(),
+            "cache":      _qido_cache.as_dict(),
+            "cursors":    {**_cursor_stats, "prefetching": len(_prefetch_tasks)},
+            "counts":     _count_cache.as_dict(),
+        },
+        "events":      {**_live_stats, "subscribers": len(_live["subscribers"])},
+        "devices":     device_cache_info(),
+        "compression": compression_metrics(),
+        "json":        {"backend": JSON_BACKEND},
+        "aggregate":   {"backend": AGGREGATE_BACKEND},
+    }
+
+
+@app.delete("/api/cache/qido")
+async def clear_qido_cache(webAppService: Optional[str] = None, resource: Optional[str] = None):
+    """Invalidate cached QIDO proxy responses (all, or one webAppService / resource prefix)."""
+    return {"invalidated": invalidate_qido_cache(webAppService, resource)}
+
+
 # ============================================================================
 # EXPORT RULES & EXPORTERS
 # ============================================================================
 
-async def _get_all_device_configs(token: str) -> list[tuple[str, dict]]:
-    """Return [(device_name, config), ...] for all devices."""
-    headers = {"Authorization": f"Bearer {token}"}
-    resp = await client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers=headers)
-    if resp.status_code != 200:
-        return []
-    names = [d["dicomDeviceName"] if isinstance(d, dict) else d for d in (resp.json() or [])]
-    configs = await asyncio.gather(*[_get_device_config(token, n) for n in names])
-    return list(zip(names, configs))
+# Listings read the device-config cache. Edits locate the device there, then apply
+# the change to its current config from dcm4chee so an external edit made since the
+# last refresh is not overwritten.
 
 
 @app.delete("/api/exporters/{exporter_id}")
 async def delete_exporter(exporter_id: str, deviceName: Optional[str] = None):
     try:
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        device_configs = await _get_all_device_configs(token)
-        for name, config in device_configs:
+        for name, cached in await cached_device_configs():
             if deviceName and name != deviceName:
                 continue
+            cached_exporters = cached.get("dcmDevice", {}).get("dcmArchiveDevice", {}).get("dcmExporter", [])
+            if not any(e.get("dcmExporterID") == exporter_id for e in cached_exporters):
+                continue
+            config = await _get_device_config(token, name)
             archive = config.get("dcmDevice", {}).get("dcmArchiveDevice", {})
             exporters = archive.get("dcmExporter", [])
             new_exporters = [e for e in exporters if e.get("dcmExporterID") != exporter_id]
             if len(new_exporters) == len(exporters):
                 continue
             archive["dcmExporter"] = new_exporters
-            put = await client.put(
-                f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{name}",
-                json=config, headers={**headers, "Content-Type": "application/json"},
-            )
-            if put.status_code not in (200, 204):
-                raise HTTPException(status_code=put.status_code, detail=put.text)
+            await _put_device_config(token, name, config)
             return {"success": True, "exporterID": exporter_id, "device": name}
         raise HTTPException(status_code=404, detail=f"Exporter '{exporter_id}' not found")
     except HTTPException:
@@ -831,8 +1243,7 @@ async def delete_exporter(exporter_id: str, deviceName: Optional[str] = None):
 @app.get("/api/exporters")
 async def list_exporters():
     try:
-        token = await get_token()
-        device_configs = await _get_all_device_configs(token)
+        device_configs = await cached_device_configs()
         result = []
         for name, config in device_configs:
             archive = config.get("dcmDevice", {}).get("dcmArchiveDevice", {})
@@ -857,14 +1268,13 @@ async def create_exporter(request: Request):
     try:
         body = await request.json()
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
 
-        device_configs = await _get_all_device_configs(token)
+        device_configs = await cached_device_configs()
         target_device = body.get("deviceName") or (device_configs[0][0] if device_configs else None)
         if not target_device:
             raise HTTPException(status_code=400, detail="No device available")
 
-        config = next((c for n, c in device_configs if n == target_device), {})
+        config = await _get_device_config(token, target_device)
         archive = config.setdefault("dcmDevice", {}).setdefault("dcmArchiveDevice", {})
         exporters = archive.setdefault("dcmExporter", [])
 
@@ -878,12 +1288,7 @@ async def create_exporter(request: Request):
         if body.get("description"): new_exp["dicomDescription"]   = body["description"]
         exporters.append(new_exp)
 
-        put = await client.put(
-            f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{target_device}",
-            json=config, headers={**headers, "Content-Type": "application/json"},
-        )
-        if put.status_code not in (200, 204):
-            raise HTTPException(status_code=put.status_code, detail=put.text)
+        await _put_device_config(token, target_device, config)
         return {"success": True, "exporterID": new_exp["dcmExporterID"], "device": target_device}
     except HTTPException:
         raise
@@ -894,8 +1299,7 @@ async def create_exporter(request: Request):
 @app.get("/api/export-rules")
 async def list_export_rules():
     try:
-        token = await get_token()
-        device_configs = await _get_all_device_configs(token)
+        device_configs = await cached_device_configs()
         result = []
         for name, config in device_configs:
             archive = config.get("dcmDevice", {}).get("dcmArchiveDevice", {})
@@ -921,14 +1325,13 @@ async def create_export_rule_endpoint(request: Request):
     try:
         body = await request.json()
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
 
-        device_configs = await _get_all_device_configs(token)
+        device_configs = await cached_device_configs()
         target_device = body.get("deviceName") or (device_configs[0][0] if device_configs else None)
         if not target_device:
             raise HTTPException(status_code=400, detail="No device available")
 
-        config = next((c for n, c in device_configs if n == target_device), {})
+        config = await _get_device_config(token, target_device)
         archive = config.setdefault("dcmDevice", {}).setdefault("dcmArchiveDevice", {})
         rules = archive.setdefault("dcmExportRule", [])
 
@@ -951,12 +1354,7 @@ async def create_export_rule_endpoint(request: Request):
 
         rules.append(new_rule)
 
-        put = await client.put(
-            f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{target_device}",
-            json=config, headers={**headers, "Content-Type": "application/json"},
-        )
-        if put.status_code not in (200, 204):
-            raise HTTPException(status_code=put.status_code, detail=put.text)
+        await _put_device_config(token, target_device, config)
         return {"success": True, "cn": rule_cn, "device": target_device}
     except HTTPException:
         raise
@@ -968,24 +1366,20 @@ async def create_export_rule_endpoint(request: Request):
 async def delete_export_rule(rule_cn: str, deviceName: Optional[str] = None):
     try:
         token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        device_configs = await _get_all_device_configs(token)
-
-        for name, config in device_configs:
+        for name, cached in await cached_device_configs():
             if deviceName and name != deviceName:
                 continue
+            cached_rules = cached.get("dcmDevice", {}).get("dcmArchiveDevice", {}).get("dcmExportRule", [])
+            if not any(r.get("cn") == rule_cn for r in cached_rules):
+                continue
+            config = await _get_device_config(token, name)
             archive = config.get("dcmDevice", {}).get("dcmArchiveDevice", {})
             rules = archive.get("dcmExportRule", [])
             new_rules = [r for r in rules if r.get("cn") != rule_cn]
             if len(new_rules) == len(rules):
                 continue
             archive["dcmExportRule"] = new_rules
-            put = await client.put(
-                f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{name}",
-                json=config, headers={**headers, "Content-Type": "application/json"},
-            )
-            if put.status_code not in (200, 204):
-                raise HTTPException(status_code=put.status_code, detail=put.text)
+            await _put_device_config(token, name, config)
             return {"success": True, "cn": rule_cn, "device": name}
 
         raise HTTPException(status_code=404, detail=f"Export rule '{rule_cn}' not found")
@@ -995,31 +1389,41 @@ async def delete_export_rule(rule_cn: str, deviceName: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+EXPORT_STATUSES = ("SCHEDULED", "IN PROCESS", "COMPLETED", "WARNING", "FAILED", "CANCELED")
+
+
+async def _export_task_counts(http: httpx.AsyncClient) -> Dict[str, Optional[int]]:
+    """
+    Export task count per status over the given lane; None for a status whose count
+    query failed.
+    """
+    token = await get_token()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def get_count(status: str) -> Optional[int]:
+        try:
+            resp = await http.get(
+                f"{DCM4CHEE_URL}/dcm4chee-arc/monitor/export/count",
+                params={"status": status},
+                headers=headers,
+                timeout=10,
+            )
+            if resp.status_code == 200:
+                data = resp.json()
+                return data.get("count", 0) if isinstance(data, dict) else int(data)
+        except Exception:
+            pass
+        return None
+
+    counts = await asyncio.gather(*[get_count(s) for s in EXPORT_STATUSES])
+    return dict(zip(EXPORT_STATUSES, counts))
+
+
 @app.get("/api/export-tasks")
 async def list_export_tasks():
     """Return aggregate export task counts by status from dcm4chee monitoring API."""
     try:
-        token = await get_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        statuses = ["SCHEDULED", "IN PROCESS", "COMPLETED", "WARNING", "FAILED", "CANCELED"]
-
-        async def get_count(status: str) -> int:
-            try:
-                resp = await client.get(
-                    f"{DCM4CHEE_URL}/dcm4chee-arc/monitor/export/count",
-                    params={"status": status},
-                    headers=headers,
-                    timeout=10,
-                )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return data.get("count", 0) if isinstance(data, dict) else int(data)
-            except Exception:
-                pass
-            return 0
-
-        counts = await asyncio.gather(*[get_count(s) for s in statuses])
-        return {s: c for s, c in zip(statuses, counts)}
+        return {s: c or 0 for s, c in (await _export_task_counts(client)).items()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1109,6 +1513,7 @@ async def cancel_export_tasks(request: Request):
             params=params, headers=headers, timeout=15,
         )
         if resp.status_code in (200, 204):
+            wake_live_events()
             return {"success": True, "count": resp.json() if resp.text else 0}
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
     except HTTPException:
@@ -1129,6 +1534,7 @@ async def reschedule_export_tasks(request: Request):
             params=params, headers=headers, timeout=15,
         )
         if resp.status_code in (200, 204):
+            wake_live_events()
             return {"success": True, "count": resp.json() if resp.text else 0}
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
     except HTTPException:
@@ -1163,6 +1569,7 @@ async def delete_export_tasks(
             params=params, headers=headers, timeout=15,
         )
         if resp.status_code in (200, 204):
+            wake_live_events()
             return {"success": True, "count": resp.json() if resp.text else 0}
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
     except HTTPException:
@@ -1213,6 +1620,122 @@ async def download_export_tasks_csv(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================================================
+# LIVE EVENTS (SSE)
+# ============================================================================
+# One poller feeds every open /api/events stream, so upstream load does not grow
+# with the number of tabs. It runs only while someone is subscribed, reads the
+# dashboard from its background snapshot (no upstream call) and the six export
+# counters from dcm4chee over the background lane, and pushes only what changed
+# since the last tick.
+
+_live: Dict = {
+    "subscribers": set(),  # one asyncio.Queue per open stream
+    "poller":      None,
+    "wake":        None,   # asyncio.Event: poll now instead of at the next interval
+    "dashboard":   None,   # last pushed dashboard stats
+    "dashboardEtag": None,
+    "exportTasks": {},     # last pushed counters
+    "seq":         0,
+}
+_live_stats: Dict = {"polls": 0, "events": 0, "dropped": 0}
+
+LIVE_QUEUE_SIZE = 32
+
+
+def wake_live_events() -> None:
+    """Have the poller run now, e.g. after export tasks were cancelled or rescheduled."""
+    if _live["wake"] is not None:
+        _live["wake"].set()
+
+
+def _sse(event: str, data) -> bytes:
+    _live["seq"] += 1
+    return b"event: " + event.encode() + b"\nid: " + str(_live["seq"]).encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+def _live_snapshot() -> bytes:
+    return _sse("snapshot", {"dashboard": _live["dashboard"], "exportTasks": _live["exportTasks"]})
+
+
+def _publish(event: str, data) -> None:
+    message = _sse(event, data)
+    for queue in _live["subscribers"]:
+        if queue.full():
+            # A stalled client gets a fresh snapshot instead of an ever-growing backlog.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_live_snapshot())
+            _live_stats["dropped"] += 1
+        else:
+            queue.put_nowait(message)
+    _live_stats["events"] += 1
+
+
+async def _poll_live() -> None:
+    if _dashboard["etag"] and _dashboard["etag"] != _live["dashboardEtag"]:
+        stats = loads(_dashboard["body"])
+        last  = _live["dashboard"] or {}
+        delta = {k: v for k, v in stats.items() if last.get(k) != v}
+        _live["dashboard"], _live["dashboardEtag"] = stats, _dashboard["etag"]
+        if delta:
+            _publish("dashboard", delta)
+
+    counts = {s: c for s, c in (await _export_task_counts(background_client)).items() if c is not None}
+    delta  = {s: c for s, c in counts.items() if _live["exportTasks"].get(s) != c}
+    if delta:
+        _live["exportTasks"] = {**_live["exportTasks"], **delta}
+        _publish("exportTasks", delta)
+    _live_stats["polls"] += 1
+
+
+async def _live_poller() -> None:
+    set_deadline(None)
+    while _live["subscribers"]:
+        _live["wake"].clear()
+        try:
+            await _poll_live()
+        except Exception as e:
+            print(f"[events] Poll failed: {e}")
+        try:
+            await asyncio.wait_for(_live["wake"].wait(), EVENTS_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    _live["poller"] = None
+
+
+async def _live_stream(queue: asyncio.Queue):
+    try:
+        yield b"retry: 5000\n\n"
+        if _live["dashboard"] is not None or _live["exportTasks"]:
+            yield _live_snapshot()
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        _live["subscribers"].discard(queue)
+
+
+@app.get("/api/events")
+async def live_events():
+    """
+    Server-Sent Events: a "snapshot" on connect, then "dashboard" (changed top-level
+    stats keys) and "exportTasks" (changed status counters) deltas.
+    """
+    queue: asyncio.Queue = asyncio.Queue(LIVE_QUEUE_SIZE)
+    _live["subscribers"].add(queue)
+    if _live["wake"] is None:
+        _live["wake"] = asyncio.Event()
+    if _live["poller"] is None:
+        _live["poller"] = asyncio.create_task(_live_poller())
+    return StreamingResponse(
+        _live_stream(queue), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ============================================================================
 # USER MANAGEMENT  (Curalink internal SQLite database)
 # ============================================================================
@@ -1446,7 +1969,12 @@ async def list_roles():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service": "dcm4chee-arc"}
+    breakers = upstream_state()["breakers"]
+    return {
+        "status":   "ok",
+        "service":  "dcm4chee-arc",
+        "upstream": {netloc: b["state"] for netloc, b in breakers.items()},
+    }
 
 
 if __name__ == "__main__":
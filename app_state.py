@@ -3,14 +3,23 @@ Shared application state: config, httpx client, token cache, DICOM helpers.
 Imported by app.py and all routers to avoid circular dependencies.
 """
 import asyncio
+import hashlib
+import json
 import os
+import sqlite3
 import time
 import httpx
-from typing import Dict, List, Optional
+from array import array
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from urllib.parse import parse_qs, urlencode
 
 from fastapi import HTTPException
 
+from crawler import crawl_pages, initial_windows
+from token_manager import BearerAuth, TokenManager
+from upstream import ResilientTransport, set_deadline
+
 # ── Config ────────────────────────────────────────────────────────────────────
 KEYCLOAK_URL            = os.getenv("KEYCLOAK_URL",            "https://172.16.16.221:8843")
 DCM4CHEE_URL            = os.getenv("DCM4CHEE_URL",            "http://172.16.16.221:8080")
@@ -22,13 +31,177 @@ GEMINI_API_KEY          = os.getenv("GEMINI_API_KEY",           "")
 GEMINI_MODEL            = os.getenv("GEMINI_MODEL",             "gemini-2.0-flash")
 DEFAULT_WEBAPP          = os.getenv("DEFAULT_WEBAPP",           "DCM4CHEE")
 
-# ── HTTP client (shared, single instance) ────────────────────────────────────
-client = httpx.AsyncClient(verify=False, timeout=30.0)
+# Incremental institution index: deltas are fetched with "<INDEX_DELTA_ATTR>=<watermark>-",
+# the watermark is moved back by INDEX_DELTA_OVERLAP seconds to absorb clock skew, and
+# removals are reconciled by a background full rebuild every HOSPITALS_FULL_RESYNC seconds.
+# dcm4chee bumps a study's update time when a series is added to it or its attributes are
+# updated, so deltas keyed on it catch those changes, not just newly received studies.
+INDEX_DELTA_ATTR        = os.getenv("INDEX_DELTA_ATTR",         "StudyUpdateDateTime")
+INDEX_DELTA_OVERLAP     = int(os.getenv("INDEX_DELTA_OVERLAP",  "120"))
+HOSPITALS_FULL_RESYNC   = int(os.getenv("HOSPITALS_FULL_RESYNC", "21600"))
+
+# Upstream connection pools. Interactive requests and background crawls / device
+# fan-outs use separate clients, so a crawl can never hold the connections a
+# user-facing QIDO query needs. HTTP/2 needs the optional `h2` package.
+UPSTREAM_HTTP2              = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+UPSTREAM_MAX_CONNECTIONS    = int(os.getenv("UPSTREAM_MAX_CONNECTIONS",    "100"))
+UPSTREAM_MAX_KEEPALIVE      = int(os.getenv("UPSTREAM_MAX_KEEPALIVE",      "20"))
+UPSTREAM_KEEPALIVE_EXPIRY   = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# Resilience: retries for idempotent requests, per-request deadline budget (see
+# the middleware in app.py) and a per-host circuit breaker.
+UPSTREAM_RETRIES            = int(os.getenv("UPSTREAM_RETRIES",            "2"))
+UPSTREAM_RETRY_BACKOFF      = float(os.getenv("UPSTREAM_RETRY_BACKOFF",    "0.2"))
+UPSTREAM_DEADLINE           = float(os.getenv("UPSTREAM_DEADLINE",         "20"))
+UPSTREAM_BREAKER_THRESHOLD  = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD",  "5"))
+UPSTREAM_BREAKER_COOLDOWN   = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+
+# Response cache for the read-only QIDO proxies (qido_cache.ResponseCache).
+# TTLs are per resource; 0 disables caching for that resource.
+QIDO_CACHE_MAX_BYTES = int(os.getenv("QIDO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QIDO_CACHE_TTLS      = {
+    "studies":  float(os.getenv("QIDO_CACHE_TTL_STUDIES",  "30")),
+    "series":   float(os.getenv("QIDO_CACHE_TTL_SERIES",   "30")),
+    "mwlitems": float(os.getenv("QIDO_CACHE_TTL_MWL",      "10")),
+    "patients": float(os.getenv("QIDO_CACHE_TTL_PATIENTS", "30")),
+}
+
+# Cursor pagination (?pageSize= / ?cursor=): studies and series are paged by keyset on
+# CURSOR_KEY_ATTR (a DT attribute every row carries; CURSOR_KEY_TAG is its DICOM JSON
+# tag), so a deep page costs the same upstream work as the first one.
+CURSOR_KEY_ATTR      = os.getenv("CURSOR_KEY_ATTR",      "StudyReceiveDateTime")
+CURSOR_KEY_TAG       = os.getenv("CURSOR_KEY_TAG",       "77771010")
+CURSOR_MAX_PAGE_SIZE = int(os.getenv("CURSOR_MAX_PAGE_SIZE", "1000"))
+
+# Response compression (compression.CompressionMiddleware): zstd / br / gzip as the
+# client accepts and the optional packages allow, for bodies of COMPRESSION_MIN_SIZE
+# bytes or more. UPSTREAM_ACCEPT_ENCODING overrides what the upstream clients ask
+# dcm4chee for (default: every encoding httpx can decode here).
+COMPRESSION_ENABLED      = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_SIZE     = int(os.getenv("COMPRESSION_MIN_SIZE",     "1024"))
+COMPRESSION_LEVELS       = {
+    "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL",   "6")),
+    "br":   int(os.getenv("COMPRESSION_BROTLI_LEVEL", "4")),
+    "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL",   "3")),
+}
+UPSTREAM_ACCEPT_ENCODING = os.getenv("UPSTREAM_ACCEPT_ENCODING", "")
+
+# Device configurations are served from memory and re-validated in the background
+# every DEVICE_CACHE_TTL seconds (see "Device configuration cache").
+DEVICE_CACHE_TTL         = float(os.getenv("DEVICE_CACHE_TTL", "60"))
+
+# The network dashboard is recomputed in the background every DASHBOARD_REFRESH_INTERVAL
+# seconds and served from memory.
+DASHBOARD_REFRESH_INTERVAL = float(os.getenv("DASHBOARD_REFRESH_INTERVAL", "60"))
+# Archive-wide totals come from QIDO count queries, cached for COUNT_CACHE_TTL seconds.
+# Archive totals move slowly, so by default they are re-counted on every fifth rebuild;
+# a TTL below the refresh interval would never be hit.
+COUNT_CACHE_TTL            = max(float(os.getenv("COUNT_CACHE_TTL", str(5 * DASHBOARD_REFRESH_INTERVAL))),
+                                 DASHBOARD_REFRESH_INTERVAL)
+# /api/events: one poller reads the export task counters every EVENTS_POLL_INTERVAL
+# seconds while anyone is subscribed; idle streams get a comment every EVENTS_HEARTBEAT.
+EVENTS_POLL_INTERVAL       = float(os.getenv("EVENTS_POLL_INTERVAL",       "5"))
+EVENTS_HEARTBEAT           = float(os.getenv("EVENTS_HEARTBEAT",           "15"))
+
+# Institution index snapshot for warm restarts, next to the user database by default.
+INDEX_DB_PATH           = os.getenv(
+    "CURALINK_INDEX_DB_PATH",
+    os.path.join(os.path.dirname(os.getenv("CURALINK_DB_PATH", "curalink_users.db")), "curalink_index.db"),
+)
+
+# Bulk crawler: windows on CRAWL_WINDOW_ATTR (a DA or DT attribute) from CRAWL_START,
+# CRAWL_WINDOW_DAYS wide, at most CRAWL_CONCURRENCY requests in flight per crawl. Full
+# crawls window on the receive time, which unlike the update time cannot move mid-crawl.
+CRAWL_WINDOW_ATTR       = os.getenv("CRAWL_WINDOW_ATTR",        "StudyReceiveDateTime")
+CRAWL_START             = os.getenv("CRAWL_START",              "20000101")
+CRAWL_WINDOW_DAYS       = int(os.getenv("CRAWL_WINDOW_DAYS",    "365"))
+CRAWL_CONCURRENCY       = int(os.getenv("CRAWL_CONCURRENCY",    "4"))
+CRAWL_PAGE_SIZE         = int(os.getenv("CRAWL_PAGE_SIZE",      "1000"))
+
+# Background lane size: room for the crawls that can overlap (a full resync's series
+# and studies crawls, a delta refresh's two, the device refresh) at CRAWL_CONCURRENCY
+# each. Beyond that, requests queue for a connection instead of timing out.
+BACKGROUND_MAX_CONNECTIONS = int(os.getenv("BACKGROUND_MAX_CONNECTIONS", str(5 * CRAWL_CONCURRENCY)))
+
+# ── HTTP clients (shared; one per priority lane) ─────────────────────────────
+
+def _http2_enabled() -> bool:
+    if not UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[upstream] UPSTREAM_HTTP2=1 but the 'h2' package is missing; using HTTP/1.1")
+        return False
+    return True
+
+
+def _make_client(max_connections: int, max_keepalive: int, pool_timeout: Optional[float] = 30.0) -> httpx.AsyncClient:
+    inner = httpx.AsyncHTTPTransport(
+        verify=False,
+        http2=_http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, pool=pool_timeout),
+        headers={"Accept-Encoding": UPSTREAM_ACCEPT_ENCODING} if UPSTREAM_ACCEPT_ENCODING else None,
+        transport=ResilientTransport(
+            inner,
+            retries=UPSTREAM_RETRIES,
+            backoff=UPSTREAM_RETRY_BACKOFF,
+            breaker_threshold=UPSTREAM_BREAKER_THRESHOLD,
+            breaker_cooldown=UPSTREAM_BREAKER_COOLDOWN,
+        ),
+    )
+
+
+# Interactive lane: user-facing queries and config reads/writes.
+client = _make_client(UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE)
+# Background lane: bulk crawls, device-config refreshes and the dashboard / live-event
+# pollers, capped separately. No pool
+# timeout: background work waits its turn for a connection rather than failing.
+background_client = _make_client(BACKGROUND_MAX_CONNECTIONS, BACKGROUND_MAX_CONNECTIONS, pool_timeout=None)
+
+# Every request on either client gets the service-account bearer token; a 401
+# from dcm4chee invalidates it and the request is retried once with a fresh token.
+token_manager = TokenManager(
+    client,
+    f"{KEYCLOAK_URL}/realms/dcm4che/protocol/openid-connect/token",
+    "dcm4chee-arc-ui", USERNAME, PASSWORD,
+)
+client.auth            = BearerAuth(token_manager)
+background_client.auth = BearerAuth(token_manager)
+
+
+def upstream_pool_info() -> dict:
+    """Lane configuration, for /api/debug/metrics."""
+    return {
+        "http2": _http2_enabled(),
+        "interactive": {"maxConnections": UPSTREAM_MAX_CONNECTIONS,
+                        "maxKeepalive": UPSTREAM_MAX_KEEPALIVE},
+        "background":  {"maxConnections": BACKGROUND_MAX_CONNECTIONS,
+                        "crawlConcurrency": CRAWL_CONCURRENCY},
+        "keepaliveExpiry": UPSTREAM_KEEPALIVE_EXPIRY,
+    }
 
 # ── In-memory caches ─────────────────────────────────────────────────────────
-_token_cache: Dict     = {"value": "", "expires_at": 0.0}
-_hospitals_cache: Dict = {"data": None, "expires_at": 0.0}
+_hospitals_cache: Dict = {"data": None, "expires_at": 0.0, "refresh_task": None}
 HOSPITALS_TTL          = 300  # seconds
+HOSPITALS_RETRY_AFTER  = 30   # seconds before retrying a failed refresh
+_index_state: Dict     = {"index": None, "resync_task": None}
+# Device configurations (see "Device configuration cache" below).
+_device_cache: Dict    = {
+    "configs": {}, "names": [], "listing_hash": None, "expires_at": 0.0, "refresh_task": None,
+    "version": 0, "ae_index": (-1, {}),  # version bumps on every config change
+}
+_device_cache_stats: Dict = {
+    "refreshes": 0, "listingChanges": 0, "fetched": 0, "notModified": 0, "unchanged": 0,
+    "changed": 0, "removed": 0, "ownWrites": 0, "failures": 0,
+}
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
@@ -37,30 +210,16 @@ def get_webapp_path(webapp: str) -> str:
 
 
 async def get_token() -> str:
-    now = time.monotonic()
-    if _token_cache["value"] and now < _token_cache["expires_at"]:
-        return _token_cache["value"]
-    url  = f"{KEYCLOAK_URL}/realms/dcm4che/protocol/openid-connect/token"
-    data = {
-        "grant_type": "password",
-        "client_id":  "dcm4chee-arc-ui",
-        "username":   USERNAME,
-        "password":   PASSWORD,
-    }
-    response = await client.post(url, data=data)
-    if response.status_code != 200:
-        raise HTTPException(status_code=401, detail="Authentication failed")
-    payload = response.json()
-    _token_cache["value"]      = payload["access_token"]
-    _token_cache["expires_at"] = now + payload.get("expires_in", 300) * 0.8
-    return _token_cache["value"]
+    return await token_manager.get()
 
 
-def clean_query_params(query_string: str) -> str:
+def clean_query_params(query_string: str, drop: Iterable[str] = ()) -> str:
+    """Re-encode a query string without webAppService and any backend-only params in drop."""
     if not query_string:
         return ""
     params = parse_qs(query_string)
-    params.pop("webAppService", None)
+    for name in ("webAppService", *drop):
+        params.pop(name, None)
     return urlencode(params, doseq=True)
 
 
@@ -77,123 +236,842 @@ def _fmt_date(raw: str) -> str:
 
 # ── Hospital / institution helpers ────────────────────────────────────────────
 
-async def _fetch_all_series(token: str, dcm_path: str) -> list:
+def _dicom_now(offset: int = 0) -> str:
+    """Current local time as a DICOM DT string (YYYYMMDDHHMMSS), shifted by offset seconds."""
+    return time.strftime("%Y%m%d%H%M%S", time.localtime(time.time() + offset))
+
+
+SERIES_INDEX_FIELDS = ("00080080", "00080081", "00081040", "00080060",
+                       "0020000D", "00100020", "00080021", "00080031", "00080020")
+STUDY_INDEX_FIELDS  = ("00080080", "00080081", "00081040", "00080061",
+                       "0020000D", "00100020", "00080020")
+
+
+def _crawl_archive(
+    token: str, dcm_path: str, resource: str, fields: tuple, since: Optional[str], name: str,
+) -> AsyncIterator[list]:
+    """
+    Windowed crawl of a QIDO resource, optionally limited to rows of studies updated
+    since `since`. Yields pages of rows projected to `fields` as they are decoded.
+    """
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
-    fields  = (
-        "&includefield=00080080,00080081,00081040,00080060"
-        ",0020000D,00100020,00080021,00080031"
-    )
-    all_series, limit, offset = [], 1000, 0
-    while True:
-        resp = await client.get(
-            f"{DCM4CHEE_URL}{dcm_path}/series?limit={limit}&offset={offset}{fields}",
-            headers=headers,
+    query   = f"includefield={','.join(fields)}"
+    if since:
+        # A delta is windowed on INDEX_DELTA_ATTR itself, starting at the watermark.
+        attr    = INDEX_DELTA_ATTR
+        windows = initial_windows(
+            attr, datetime.strptime(since, "%Y%m%d%H%M%S"), datetime.now(),
+            CRAWL_WINDOW_DAYS, open_start=False,
         )
-        if resp.status_code in (200,):
-            page = resp.json() or []
-            all_series.extend(page)
-            if len(page) < limit:
-                break
-            offset += limit
-        else:
-            break
-    return all_series
-
-
-async def _fetch_all_studies_sup(token: str, dcm_path: str) -> list:
-    headers    = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
-    fields     = "&includefield=00080080,00080081,00081040,00080061,0020000D,00100020,00080020"
-    all_studies, limit, offset = [], 1000, 0
-    while True:
-        resp = await client.get(
-            f"{DCM4CHEE_URL}{dcm_path}/studies?limit={limit}&offset={offset}{fields}",
-            headers=headers,
+    else:
+        attr    = CRAWL_WINDOW_ATTR
+        windows = initial_windows(
+            attr, datetime.strptime(CRAWL_START, "%Y%m%d"), datetime.now(), CRAWL_WINDOW_DAYS,
         )
-        if resp.status_code == 200:
-            page = resp.json() or []
-            all_studies.extend(page)
-            if len(page) < limit:
-                break
-            offset += limit
-        else:
-            break
-    return all_studies
+    return crawl_pages(
+        background_client, f"{DCM4CHEE_URL}{dcm_path}/{resource}", headers, query,
+        name=name, window_attr=attr, windows=windows,
+        page_size=CRAWL_PAGE_SIZE, concurrency=CRAWL_CONCURRENCY, keep=fields,
+    )
+
+
+def _uid_hash(value: str) -> int:
+    """Stable, non-zero signed 64-bit id for a UID / PatientID string."""
+    h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little", signed=True)
+    return h or 1
+
+
+class IdSet:
+    """
+    Set of 64-bit ids in an open-addressing table backed by array('q').
+
+    Costs 8 bytes per slot (at most 75% full) instead of a Python str plus set
+    entry per member. 0 marks an empty slot, which _uid_hash never returns.
+    """
+    __slots__ = ("_slots", "_mask", "_count")
+
+    def __init__(self) -> None:
+        self._slots = array("q", bytes(8 * 16))
+        self._mask  = 15
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, h: int) -> None:
+        slots, mask = self._slots, self._mask
+        i = h & mask
+        while True:
+            v = slots[i]
+            if v == h:
+                return
+            if v == 0:
+                slots[i] = h
+                self._count += 1
+                if self._count * 4 > (mask + 1) * 3:
+                    self._grow()
+                return
+            i = (i + 1) & mask
+
+    def to_bytes(self) -> bytes:
+        return self._slots.tobytes()
 
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "IdSet":
+        ids = cls()
+        ids._slots = array("q")
+        ids._slots.frombytes(data)
+        size = len(ids._slots)
+        if size < 16 or size & (size - 1):
+            raise ValueError(f"IdSet table size {size} is not a power of two")
+        ids._mask  = size - 1
+        ids._count = len(ids._slots) - ids._slots.count(0)
+        return ids
 
-def _build_institutions_from_series(
-    series_list: list, studies_list: Optional[list] = None
-) -> List[dict]:
-    buckets: Dict[str, dict] = {}
+    def _grow(self) -> None:
+        old = self._slots
+        self._slots = array("q", bytes(16 * len(old)))
+        self._mask  = 2 * len(old) - 1
+        self._count = 0
+        for v in old:
+            if v:
+                self.add(v)
 
-    def _ensure(inst_name: str, address: str) -> dict:
-        if inst_name not in buckets:
-            buckets[inst_name] = {
-                "address": address, "study_uids": set(),
-                "patient_ids": set(), "modalities": set(),
-                "departments": set(), "dates": [],
+
+class InstitutionIndex:
+    """
+    Per-institution accumulators keyed by InstitutionName (0008,0080).
+
+    Study UIDs and patient IDs are kept as 64-bit hashes in IdSets and only the
+    latest date is tracked, so memory no longer grows with full UID strings.
+
+    Applying the same series/study rows twice is a no-op, so overlapping delta
+    windows are safe. Rows that move to another institution or are deleted stay
+    counted until the next full rebuild replaces the index.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[str, dict] = {}
+        self.watermark: Optional[str] = None  # DICOM DT the next delta starts from
+        self.full_synced_at: float    = 0.0   # monotonic time of the last full build
+
+    def _ensure(self, inst_name: str, address: str) -> dict:
+        b = self.buckets.get(inst_name)
+        if b is None:
+            b = self.buckets[inst_name] = {
+                "address": address, "study_uids": IdSet(),
+                "patient_ids": IdSet(), "modalities": set(),
+                "departments": set(), "last_date": "",
+            }
+        return b
+
+    def add_series(self, series_list: Iterable[dict]) -> None:
+        for s in series_list:
+            inst = (_gv(s, "00080080") or "").strip()
+            if not inst:
+                continue
+            b = self._ensure(inst, _gv(s, "00080081") or "")
+            uid  = _gv(s, "0020000D"); uid  and b["study_uids"].add(_uid_hash(uid))
+            pid  = _gv(s, "00100020"); pid  and b["patient_ids"].add(_uid_hash(pid))
+            mod  = _gv(s, "00080060"); mod  and b["modalities"].add(mod)
+            dept = _gv(s, "00081040"); dept and b["departments"].add(dept)
+            d    = _gv(s, "00080021")
+            if d and d > b["last_date"]:
+                b["last_date"] = d
+
+    def add_studies(self, studies_list: Iterable[dict]) -> None:
+        for study in studies_list:
+            inst = (_gv(study, "00080080") or "").strip()
+            if not inst:
+                continue
+            b = self._ensure(inst, _gv(study, "00080081") or "")
+            uid  = _gv(study, "0020000D"); uid  and b["study_uids"].add(_uid_hash(uid))
+            pid  = _gv(study, "00100020"); pid  and b["patient_ids"].add(_uid_hash(pid))
+            for mod in (study.get("00080061", {}).get("Value", []) or []):
+                mod and b["modalities"].add(mod)
+            dept = _gv(study, "00081040"); dept and b["departments"].add(dept)
+            d    = _gv(study, "00080020")
+            if d and d > b["last_date"]:
+                b["last_date"] = d
+
+    def institutions(self) -> List[dict]:
+        result = []
+        for i, (name, b) in enumerate(
+            sorted(self.buckets.items(), key=lambda x: -len(x[1]["study_uids"]))
+        ):
+            result.append({
+                "id":              i + 1,
+                "name":            name,
+                "institutionName": name,
+                "address":         b["address"],
+                "status":          "active",
+                "studyCount":      len(b["study_uids"]),
+                "patientCount":    len(b["patient_ids"]),
+                "modalities":      sorted(b["modalities"]),
+                "departments":     sorted(b["departments"]),
+                "lastStudyDate":   _fmt_date(b["last_date"]) if b["last_date"] else None,
+            })
+        return result
+
+
+# ── Institution index snapshot (SQLite) ──────────────────────────────────────
+
+def _index_snapshot_rows(index: InstitutionIndex) -> tuple:
+    """Copy the index into plain rows (on the event loop, so no delta can interleave)."""
+    meta = (index.watermark, time.time() - (time.monotonic() - index.full_synced_at), time.time())
+    rows = [
+        (name, b["address"], b["study_uids"].to_bytes(), b["patient_ids"].to_bytes(),
+         json.dumps(sorted(b["modalities"])), json.dumps(sorted(b["departments"])),
+         b["last_date"])
+        for name, b in index.buckets.items()
+    ]
+    return meta, rows
+
+
+def _save_index_snapshot(meta: tuple, rows: list) -> None:
+    """Persist index rows and watermark, replacing the previous snapshot."""
+    conn = sqlite3.connect(INDEX_DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS institution_index_meta (
+                id             INTEGER PRIMARY KEY CHECK (id = 1),
+                watermark      TEXT,
+                full_synced_at REAL,
+                saved_at       REAL
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS institution_index_buckets (
+                name        TEXT PRIMARY KEY,
+                address     TEXT,
+                study_uids  BLOB,
+                patient_ids BLOB,
+                modalities  TEXT,
+                departments TEXT,
+                last_date   TEXT
+            )
+        """)
+        c.execute("DELETE FROM institution_index_buckets")
+        c.executemany("INSERT INTO institution_index_buckets VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        c.execute("INSERT OR REPLACE INTO institution_index_meta VALUES (1, ?, ?, ?)", meta)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _load_index_snapshot() -> Optional[InstitutionIndex]:
+    """Rebuild the index from the last snapshot, or None if there is none."""
+    if not os.path.exists(INDEX_DB_PATH):
+        return None
+    conn = sqlite3.connect(INDEX_DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT watermark, full_synced_at FROM institution_index_meta WHERE id = 1")
+        meta = c.fetchone()
+        if not meta:
+            return None
+        index = InstitutionIndex()
+        index.watermark      = meta[0]
+        index.full_synced_at = time.monotonic() - (time.time() - meta[1])
+        for name, address, uids, pids, mods, depts, last_date in c.execute(
+            "SELECT * FROM institution_index_buckets"
+        ):
+            index.buckets[name] = {
+                "address":     address,
+                "study_uids":  IdSet.from_bytes(uids),
+                "patient_ids": IdSet.from_bytes(pids),
+                "modalities":  set(json.loads(mods)),
+                "departments": set(json.loads(depts)),
+                "last_date":   last_date,
             }
-        return buckets[inst_name]
+        return index
+    except (sqlite3.Error, ValueError, TypeError) as e:
+        # A damaged warm-start cache must never keep the service from starting.
+        print(f"[hospitals] Ignoring unreadable index snapshot: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+_persist_lock = asyncio.Lock()
+
+
+async def _persist_index(index: InstitutionIndex) -> None:
+    # Saves run one at a time, and only for the current index: a delta that finished on
+    # an index a full resync has since replaced must not overwrite the newer snapshot.
+    async with _persist_lock:
+        if index is not _index_state["index"]:
+            return
+        try:
+            await asyncio.to_thread(_save_index_snapshot, *_index_snapshot_rows(index))
+        except Exception as e:
+            print(f"[hospitals] Could not save index snapshot: {e}")
+
+
+# ── Study → institution index (SQLite) ───────────────────────────────────────
+# One row per StudyInstanceUID with the institution its series/study rows name,
+# written by the same crawls that feed InstitutionIndex, so per-hospital views can
+# look up their study UIDs locally and query dcm4chee for exactly those studies.
+
+STUDY_UID_BATCH = 100  # UIDs per targeted QIDO query (keeps URLs well under 8 KB)
+_study_index_lock = asyncio.Lock()
+
+
+def _study_index_conn() -> sqlite3.Connection:
+    """Connection to the index database with the study_institution and rollup tables in place."""
+    conn = sqlite3.connect(INDEX_DB_PATH, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS study_institution (
+            study_uid   TEXT PRIMARY KEY,
+            institution TEXT NOT NULL,
+            study_date  TEXT,
+            seen_at     REAL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_study_institution_inst
+        ON study_institution (institution COLLATE NOCASE, study_date)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_facts (
+            study_uid   TEXT NOT NULL,
+            modality    TEXT NOT NULL,
+            day         TEXT NOT NULL,
+            institution TEXT NOT NULL,
+            seen_at     REAL,
+            PRIMARY KEY (study_uid, modality)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS study_rollup (
+            day         TEXT NOT NULL,
+            institution TEXT NOT NULL,
+            modality    TEXT NOT NULL,
+            studies     INTEGER NOT NULL,
+            PRIMARY KEY (day, institution, modality)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_meta (
+            id            INTEGER PRIMARY KEY CHECK (id = 1),
+            backfilled_at REAL
+        )
+    """)
+    return conn
+
+
+def _write_study_institutions(rows: List[tuple]) -> None:
+    conn = _study_index_conn()
+    try:
+        conn.executemany("""
+            INSERT INTO study_institution VALUES (?, ?, ?, ?)
+            ON CONFLICT(study_uid) DO UPDATE SET
+                institution = excluded.institution,
+                study_date  = COALESCE(NULLIF(excluded.study_date, ''), study_date),
+                seen_at     = excluded.seen_at
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _prune_study_institutions(before: float) -> int:
+    """Drop studies a full crawl started at `before` did not see (deleted or moved)."""
+    conn = _study_index_conn()
+    try:
+        n = conn.execute("DELETE FROM study_institution WHERE seen_at < ?", (before,)).rowcount
+        conn.commit()
+        return n
+    finally:
+        conn.close()
+
+
+def _query_study_uids(institution: str, limit: int) -> List[str]:
+    conn = _study_index_conn()
+    try:
+        return [row[0] for row in conn.execute("""
+            SELECT study_uid FROM study_institution
+            WHERE institution = ? COLLATE NOCASE
+            ORDER BY study_date DESC LIMIT ?
+        """, (institution, limit))]
+    finally:
+        conn.close()
+
+
+# ── Study rollups (SQLite) ───────────────────────────────────────────────────
+# study_rollup holds studies per (day, institution, modality), with modality ""
+# counting each study once. It is maintained incrementally from series rows through
+# rollup_facts, one row per (study, modality) recording where it was counted, so
+# re-applied or moved studies adjust the counts instead of inflating them.
+
+ROLLUP_PERIODS = {
+    "day":   "day",
+    "week":  "date(day, '-6 days', 'weekday 1')",  # Monday of the ISO week
+    "month": "substr(day, 1, 7)",
+}
 
-    for s in series_list:
+
+def _apply_rollup_deltas(conn: sqlite3.Connection, deltas: Dict[tuple, int]) -> None:
+    conn.executemany("""
+        INSERT INTO study_rollup VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, institution, modality) DO UPDATE SET studies = studies + excluded.studies
+    """, [(*key, n) for key, n in deltas.items() if n])
+    if any(n < 0 for n in deltas.values()):
+        conn.execute("DELETE FROM study_rollup WHERE studies <= 0")
+
+
+def _write_rollup_facts(facts: Dict[tuple, tuple], seen_at: float) -> None:
+    """facts: (study_uid, modality) -> (day, institution)."""
+    conn = _study_index_conn()
+    try:
+        deltas: Dict[tuple, int] = {}
+        for (uid, mod), (day, inst) in facts.items():
+            old = conn.execute(
+                "SELECT day, institution FROM rollup_facts WHERE study_uid = ? AND modality = ?", (uid, mod),
+            ).fetchone()
+            if old == (day, inst):
+                continue
+            if old:
+                deltas[(*old, mod)] = deltas.get((*old, mod), 0) - 1
+            deltas[(day, inst, mod)] = deltas.get((day, inst, mod), 0) + 1
+        conn.executemany("""
+            INSERT INTO rollup_facts VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(study_uid, modality) DO UPDATE SET
+                day = excluded.day, institution = excluded.institution, seen_at = excluded.seen_at
+        """, [(uid, mod, day, inst, seen_at) for (uid, mod), (day, inst) in facts.items()])
+        _apply_rollup_deltas(conn, deltas)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _prune_rollup(before: float) -> None:
+    """Uncount facts a full crawl started at `before` did not see, and mark the rollup backfilled."""
+    conn = _study_index_conn()
+    try:
+        stale = conn.execute("""
+            SELECT day, institution, modality, COUNT(*) FROM rollup_facts
+            WHERE seen_at < ? GROUP BY day, institution, modality
+        """, (before,)).fetchall()
+        _apply_rollup_deltas(conn, {(d, i, m): -n for d, i, m, n in stale})
+        conn.execute("DELETE FROM rollup_facts WHERE seen_at < ?", (before,))
+        conn.execute("INSERT OR REPLACE INTO rollup_meta VALUES (1, ?)", (time.time(),))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _rollup_backfilled() -> bool:
+    if not os.path.exists(INDEX_DB_PATH):
+        return False
+    conn = _study_index_conn()
+    try:
+        return conn.execute("SELECT 1 FROM rollup_meta WHERE id = 1").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def _study_index_empty() -> bool:
+    conn = _study_index_conn()
+    try:
+        return conn.execute("SELECT 1 FROM study_institution LIMIT 1").fetchone() is None
+    finally:
+        conn.close()
+
+
+def _query_rollup(period: str, start: str, end: str, institution: Optional[str]) -> list:
+    sql    = (f"SELECT {ROLLUP_PERIODS[period]} AS period, modality, SUM(studies) "
+              "FROM study_rollup WHERE day BETWEEN ? AND ?")
+    params: list = [start, end]
+    if institution is not None:
+        sql += " AND institution = ? COLLATE NOCASE"
+        params.append(institution)
+    conn = _study_index_conn()
+    try:
+        return conn.execute(sql + " GROUP BY period, modality ORDER BY period", params).fetchall()
+    finally:
+        conn.close()
+
+
+async def _record_rollup(series_rows: List[dict]) -> None:
+    facts: Dict[tuple, tuple] = {}
+    for s in series_rows:
+        uid  = _gv(s, "0020000D")
         inst = (_gv(s, "00080080") or "").strip()
-        if not inst:
-            continue
-        b = _ensure(inst, _gv(s, "00080081") or "")
-        uid  = _gv(s, "0020000D"); uid  and b["study_uids"].add(uid)
-        pid  = _gv(s, "00100020"); pid  and b["patient_ids"].add(pid)
-        mod  = _gv(s, "00080060"); mod  and b["modalities"].add(mod)
-        dept = _gv(s, "00081040"); dept and b["departments"].add(dept)
-        d    = _gv(s, "00080021"); d    and b["dates"].append(d)
-
-    for study in (studies_list or []):
-        inst = (_gv(study, "00080080") or "").strip()
-        if not inst:
+        day  = _gv(s, "00080020") or _gv(s, "00080021")
+        if not (uid and inst and len(day) == 8):
             continue
-        b = _ensure(inst, _gv(study, "00080081") or "")
-        uid  = _gv(study, "0020000D"); uid  and b["study_uids"].add(uid)
-        pid  = _gv(study, "00100020"); pid  and b["patient_ids"].add(pid)
-        for mod in (study.get("00080061", {}).get("Value", []) or []):
-            mod and b["modalities"].add(mod)
-        dept = _gv(study, "00081040"); dept and b["departments"].add(dept)
-        d    = _gv(study, "00080020"); d    and b["dates"].append(d)
-
-    result = []
-    for i, (name, b) in enumerate(
-        sorted(buckets.items(), key=lambda x: -len(x[1]["study_uids"]))
-    ):
-        result.append({
-            "id":              i + 1,
-            "name":            name,
-            "institutionName": name,
-            "address":         b["address"],
-            "status":          "active",
-            "studyCount":      len(b["study_uids"]),
-            "patientCount":    len(b["patient_ids"]),
-            "modalities":      sorted(b["modalities"]),
-            "departments":     sorted(b["departments"]),
-            "lastStudyDate":   _fmt_date(max(b["dates"])) if b["dates"] else None,
-        })
-    return result
+        day = _fmt_date(day)
+        facts[(uid, "")] = (day, inst)
+        mod = _gv(s, "00080060")
+        if mod:
+            facts[(uid, mod)] = (day, inst)
+    if facts:
+        async with _study_index_lock:
+            await asyncio.to_thread(_write_rollup_facts, facts, time.time())
+
+
+async def study_trend(period: str, start: str, end: str, institution: Optional[str] = None) -> dict:
+    """
+    Studies per day/week/month between two YYYY-MM-DD dates (inclusive), in total and
+    per modality, optionally for one institution. `backfilled` is false until the
+    first full crawl has populated the rollup.
+    """
+    rows    = await asyncio.to_thread(_query_rollup, period, start, end, institution)
+    periods: Dict[str, dict] = {}
+    for key, mod, n in rows:
+        p = periods.setdefault(key, {"period": key, "studies": 0, "byModality": {}})
+        if mod:
+            p["byModality"][mod] = n
+        else:
+            p["studies"] = n
+    return {
+        "granularity": period,
+        "from":        start,
+        "to":          end,
+        "backfilled":  await asyncio.to_thread(_rollup_backfilled),
+        "periods":     list(periods.values()),
+    }
+
+
+async def _record_study_institutions(rows: List[dict], date_tag: str) -> None:
+    now   = time.time()
+    pairs = [
+        (uid, inst, _gv(r, date_tag), now)
+        for r in rows
+        for uid, inst in [(_gv(r, "0020000D"), (_gv(r, "00080080") or "").strip())]
+        if uid and inst
+    ]
+    if pairs:
+        async with _study_index_lock:
+            await asyncio.to_thread(_write_study_institutions, pairs)
+
+
+async def lookup_study_uids(institution: str, limit: int = 2000) -> List[str]:
+    """Most recent StudyInstanceUIDs recorded for an institution (case-insensitive)."""
+    return await asyncio.to_thread(_query_study_uids, institution, limit)
+
+
+async def fetch_studies_by_uid(token: str, dcm_path: str, uids: List[str], includefields: str) -> list:
+    """Fetch exactly these studies, STUDY_UID_BATCH UIDs per QIDO query, a few queries at a time."""
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/dicom+json"}
+    sem     = asyncio.Semaphore(CRAWL_CONCURRENCY)
+
+    async def _batch(batch: List[str]) -> list:
+        async with sem:
+            resp = await client.get(
+                f"{DCM4CHEE_URL}{dcm_path}/studies",
+                params={"StudyInstanceUID": ",".join(batch), "includefield": includefields,
+                        "limit": str(len(batch))},
+                headers=headers,
+            )
+        if resp.status_code == 204:
+            return []
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        return resp.json()
+
+    pages = await asyncio.gather(*[
+        _batch(uids[i:i + STUDY_UID_BATCH]) for i in range(0, len(uids), STUDY_UID_BATCH)
+    ])
+    studies = [s for page in pages for s in page]
+    studies.sort(key=lambda s: _gv(s, "00080020") or "", reverse=True)
+    return studies
+
+
+def _warm_start() -> None:
+    """Serve the last snapshot immediately; it is already expired so the first request refreshes it."""
+    t0    = time.perf_counter()
+    index = _load_index_snapshot()
+    if index is None:
+        return
+    _index_state["index"]    = index
+    _hospitals_cache["data"] = index.institutions()
+    print(f"[hospitals] warm start: {len(index.buckets)} institutions from snapshot "
+          f"(watermark {index.watermark}) in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+async def _feed_index(index: InstitutionIndex, since: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Stream series and study pages straight into the index; each crawl keeps at most
+    CRAWL_CONCURRENCY pages in flight or waiting here. Returns (series rows, study rows) applied.
+    """
+    token    = await get_token()
+    dcm_path = get_webapp_path(DEFAULT_WEBAPP)
+    suffix   = "-delta" if since else ""
+
+    async def _series() -> int:
+        n = 0
+        async for page in _crawl_archive(
+            token, dcm_path, "series", SERIES_INDEX_FIELDS, since, "series" + suffix,
+        ):
+            index.add_series(page)
+            await _record_study_institutions(page, "00080021")
+            await _record_rollup(page)
+            n += len(page)
+        return n
+
+    async def _studies() -> int:
+        n = 0
+        async for page in _crawl_archive(
+            token, dcm_path, "studies", STUDY_INDEX_FIELDS, since, "studies" + suffix,
+        ):
+            index.add_studies(page)
+            await _record_study_institutions(page, "00080020")
+            n += len(page)
+        return n
+
+    n_series, n_studies = await asyncio.gather(_series(), _studies())
+    return n_series, n_studies
+
+
+async def _full_build_index() -> InstitutionIndex:
+    """Crawl every series and study into a fresh index."""
+    watermark = _dicom_now(-INDEX_DELTA_OVERLAP)
+    started   = time.time()
+    index     = InstitutionIndex()
+    n_series, n_studies = await _feed_index(index)
+    index.watermark      = watermark
+    index.full_synced_at = time.monotonic()
+    async with _study_index_lock:
+        pruned = await asyncio.to_thread(_prune_study_institutions, started)
+        await asyncio.to_thread(_prune_rollup, started)
+    print(f"[hospitals] full build: {len(index.buckets)} institutions from "
+          f"{n_series} series + {n_studies} studies ({pruned} stale study UIDs pruned)")
+    return index
+
+
+async def _apply_index_delta(index: InstitutionIndex) -> None:
+    """Fold series and studies received since the index watermark into the index."""
+    watermark = _dicom_now(-INDEX_DELTA_OVERLAP)
+    n_series, n_studies = await _feed_index(index, since=index.watermark)
+    print(f"[hospitals] delta since {index.watermark}: "
+          f"{n_series} series + {n_studies} studies")
+    index.watermark = watermark
+
+
+async def _run_full_resync() -> None:
+    """Rebuild the index from scratch to drop deleted/moved rows, then swap it in."""
+    set_deadline(None)
+    try:
+        index = await _full_build_index()
+        _index_state["index"]          = index
+        _hospitals_cache["data"]       = index.institutions()
+        _hospitals_cache["expires_at"] = time.monotonic() + HOSPITALS_TTL
+        await _persist_index(index)
+    except Exception as e:
+        print(f"[hospitals] Full resync failed: {e}")
+
+
+def _schedule_full_resync() -> None:
+    task = _index_state["resync_task"]
+    if task is None or task.done():
+        _index_state["resync_task"] = asyncio.create_task(_run_full_resync())
+
+
+async def _refresh_hospitals() -> list:
+    """
+    Sync the institution index and publish a new snapshot. On failure the last
+    good snapshot stays in place and the next attempt is HOSPITALS_RETRY_AFTER away.
+    """
+    set_deadline(None)  # background work: not bound by the triggering request's budget
+    try:
+        index = _index_state["index"]
+        if index is None:
+            index = _index_state["index"] = await _full_build_index()
+        else:
+            await _apply_index_delta(index)
+            if index is not _index_state["index"]:
+                # A full resync swapped in a newer index (and published it) meanwhile.
+                return _hospitals_cache["data"] or []
+            # A snapshot from before the rollup / study index existed (or restored without
+            # the study table) needs one full crawl to backfill them.
+            if (time.monotonic() - index.full_synced_at > HOSPITALS_FULL_RESYNC
+                    or not await asyncio.to_thread(_rollup_backfilled)
+                    or (index.buckets and await asyncio.to_thread(_study_index_empty))):
+                _schedule_full_resync()
+        _hospitals_cache["data"]       = index.institutions()
+        _hospitals_cache["expires_at"] = time.monotonic() + HOSPITALS_TTL
+        await _persist_index(index)
+    except Exception as e:
+        print(f"[hospitals] Refresh failed, serving last snapshot: {e}")
+        _hospitals_cache["expires_at"] = time.monotonic() + HOSPITALS_RETRY_AFTER
+    return _hospitals_cache["data"] or []
 
 
 async def fetch_hospitals_cached() -> list:
-    """Build institution list from series+studies, cached for HOSPITALS_TTL seconds."""
+    """
+    Institution list from the incremental index, cached for HOSPITALS_TTL seconds.
+
+    The first call crawls the whole archive; later refreshes only fetch rows
+    received since the last watermark. Every HOSPITALS_FULL_RESYNC seconds a full
+    rebuild runs in the background to reconcile removals.
+
+    Only one refresh runs at a time. Until the first snapshot exists callers
+    await it; afterwards an expired snapshot is returned immediately while the
+    refresh runs in the background. After a failed first build callers get an
+    empty list until HOSPITALS_RETRY_AFTER has passed, rather than a new crawl each.
+    """
     now = time.monotonic()
-    if _hospitals_cache["data"] is not None and now < _hospitals_cache["expires_at"]:
+    if now < _hospitals_cache["expires_at"]:
+        return _hospitals_cache["data"] or []
+    task = _hospitals_cache["refresh_task"]
+    if task is None or task.done():
+        task = _hospitals_cache["refresh_task"] = asyncio.create_task(_refresh_hospitals())
+    if _hospitals_cache["data"] is not None:
         return _hospitals_cache["data"]
+    # shield: a cancelled caller must not cancel the refresh the others are awaiting
+    return await asyncio.shield(task)
+
+
+
+# ── Device configuration cache ───────────────────────────────────────────────
+# Full device JSON per device, kept in memory for the exporter / rule listings.
+# A refresh lists the devices (one small request; its hash tells whether devices
+# were added or removed) and re-validates each config: a conditional GET when
+# dcm4chee sent an ETag / Last-Modified, else a blake2b hash of the body, so an
+# unchanged config is neither parsed nor replaced. Our own PUTs write through.
+
+def _body_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+async def _fetch_device_names(token: str) -> Tuple[List[str], str]:
+    resp = await background_client.get(
+        f"{DCM4CHEE_URL}/dcm4chee-arc/devices", headers={"Authorization": f"Bearer {token}"},
+    )
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    names = [d["dicomDeviceName"] if isinstance(d, dict) else d for d in (resp.json() or [])]
+    return names, _body_hash(resp.content)
+
+
+async def _revalidate_device(token: str, name: str) -> None:
+    entry   = _device_cache["configs"].get(name)
+    headers = {"Authorization": f"Bearer {token}"}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    resp = await background_client.get(f"{DCM4CHEE_URL}/dcm4chee-arc/devices/{name}", headers=headers)
+    _device_cache_stats["fetched"] += 1
+    if resp.status_code == 304 and entry:
+        _device_cache_stats["notModified"] += 1
+        return
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    digest = _body_hash(resp.content)
+    if entry and entry["hash"] == digest:
+        _device_cache_stats["unchanged"] += 1
+        return
+    if entry and entry["hash"] is not None:  # None: our own write, now confirmed
+        _device_cache_stats["changed"] += 1
+    _device_cache["version"] += 1
+    _device_cache["configs"][name] = {
+        "config":        resp.json(),
+        "hash":          digest,
+        "etag":          resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+    }
+
+
+async def _refresh_device_configs() -> None:
+    set_deadline(None)  # background work: not bound by the triggering request's budget
     try:
-        token    = await get_token()
-        dcm_path = get_webapp_path(DEFAULT_WEBAPP)
-        series_list, studies_sup = await asyncio.gather(
-            _fetch_all_series(token, dcm_path),
-            _fetch_all_studies_sup(token, dcm_path),
-        )
-        institutions = _build_institutions_from_series(series_list, studies_sup)
-        print(f"[hospitals] {len(institutions)} institutions from "
-              f"{len(series_list)} series + {len(studies_sup)} studies")
-        _hospitals_cache["data"]       = institutions
-        _hospitals_cache["expires_at"] = now + HOSPITALS_TTL
-        return institutions
+        token = await get_token()
+        names, listing_hash = await _fetch_device_names(token)
+        if listing_hash != _device_cache["listing_hash"]:
+            _device_cache_stats["listingChanges"] += 1
+            for gone in set(_device_cache["configs"]) - set(names):
+                del _device_cache["configs"][gone]
+                _device_cache_stats["removed"] += 1
+            _device_cache["version"] += 1
+        sem = asyncio.Semaphore(CRAWL_CONCURRENCY)
+
+        async def _one(name: str) -> None:
+            async with sem:
+                try:
+                    await _revalidate_device(token, name)
+                except Exception as e:
+                    # Keep the last good config of this device; the others still refresh.
+                    _device_cache_stats["failures"] += 1
+                    print(f"[devices] Refresh of {name} failed: {e}")
+
+        await asyncio.gather(*[_one(n) for n in names])
+        _device_cache["names"]        = names
+        _device_cache["listing_hash"] = listing_hash
+        _device_cache["expires_at"]   = time.monotonic() + DEVICE_CACHE_TTL
+        _device_cache_stats["refreshes"] += 1
     except Exception as e:
-        print(f"[hospitals] Error: {e}")
-        return []
+        print(f"[devices] Refresh failed, serving cached configs: {e}")
+        _device_cache_stats["failures"] += 1
+        _device_cache["expires_at"] = time.monotonic() + HOSPITALS_RETRY_AFTER
+
+
+def refresh_device_configs() -> "asyncio.Future":
+    """Start a device-config refresh unless one is running; callers share it."""
+    task = _device_cache["refresh_task"]
+    if task is None or task.done():
+        task = _device_cache["refresh_task"] = asyncio.ensure_future(_refresh_device_configs())
+    # shield: a cancelled caller must not cancel the refresh the others are awaiting
+    return asyncio.shield(task)
+
+
+async def cached_device_configs() -> List[Tuple[str, dict]]:
+    """
+    [(device_name, config), ...] from memory. The first call waits for the initial
+    load; after DEVICE_CACHE_TTL the cached configs are returned while a refresh
+    runs in the background. The configs are shared: copy before modifying.
+    """
+    if not _device_cache["names"] and _device_cache["listing_hash"] is None:
+        await refresh_device_configs()
+    elif time.monotonic() >= _device_cache["expires_at"]:
+        refresh_device_configs()
+    configs = _device_cache["configs"]
+    return [(n, configs[n]["config"]) for n in _device_cache["names"] if n in configs]
+
+
+def store_device_config(name: str, config: dict) -> None:
+    """Write-through after our own PUT; the next refresh re-validates it against dcm4chee."""
+    _device_cache["configs"][name] = {"config": config, "hash": None, "etag": None, "last_modified": None}
+    _device_cache["version"] += 1
+    if name not in _device_cache["names"]:
+        _device_cache["names"] = [*_device_cache["names"], name]
+        _device_cache["listing_hash"] = None
+    _device_cache_stats["ownWrites"] += 1
+
+
+def _build_ae_index() -> Dict[str, Tuple[str, int]]:
+    index: Dict[str, Tuple[str, int]] = {}
+    for name in _device_cache["names"]:
+        entry = _device_cache["configs"].get(name)
+        for idx, ae in enumerate((entry or {}).get("config", {}).get("dicomNetworkAE", [])):
+            # setdefault: a title on several devices resolves to the first, as the serial scan did
+            index.setdefault(ae.get("dicomAETitle"), (name, idx))
+    return index
+
+
+async def ae_owner(ae_title: str) -> Optional[Tuple[str, int]]:
+    """
+    (device_name, index into dicomNetworkAE) of the device that owns ae_title, or
+    None. The map is derived from the device-config cache and rebuilt only after a
+    config changed, so lookups are a dict read.
+    """
+    await cached_device_configs()
+    version, index = _device_cache["ae_index"]
+    if version != _device_cache["version"]:
+        index = _build_ae_index()
+        _device_cache["ae_index"] = (_device_cache["version"], index)
+    return index.get(ae_title)
+
+
+def device_cache_info() -> dict:
+    return {
+        **_device_cache_stats,
+        "devices":      len(_device_cache["configs"]),
+        "aeTitles":     len(_device_cache["ae_index"][1]),
+        "refreshingIn": max(0.0, round(_device_cache["expires_at"] - time.monotonic(), 1)),
+    }
+
+_warm_start()
@@ -0,0 +1,101 @@
+"""
+CPU benchmark: per-study dashboard aggregation loop vs aggregate.StudyColumns.
+
+    python benchmarks/bench_dashboard_aggregate.py [sizes...]
+
+For 10k / 100k / 1M synthetic DICOM JSON studies (or the sizes given) it times:
+- loop:     the former _aggregate_stats loop (_gv / _fmt_date / int() per study)
+- columnar: StudyColumns.from_studies + totals and both histograms, with the decode
+            and the aggregation reported separately (NumPy if installed)
+and checks that both produce the same totals and histograms. Times are the
+median of 3 runs.
+"""
+import os
+import statistics
+import sys
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregate import BACKEND, StudyColumns, aggregate_studies  # noqa: E402
+
+MODALITIES = ("CT", "MR", "US", "CR", "DX", "MG", "NM", "PT", "XA", "RF")
+
+
+def _study(i: int) -> dict:
+    return {
+        "00080020": {"vr": "DA", "Value": [f"20{10 + i % 15}{1 + i % 12:02d}{1 + i % 28:02d}"]},
+        "00080050": {"vr": "SH", "Value": [f"ACC{i:08d}"]},
+        "00080061": {"vr": "CS", "Value": [MODALITIES[i % 10], "SR"][: 1 + i % 2]},
+        "00100020": {"vr": "LO", "Value": [f"PID{i // 3:010d}"]},
+        "0020000D": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{i}"]},
+        "00201206": {"vr": "IS", "Value": [1 + i % 7]},
+        "00201208": {"vr": "IS", "Value": [50 + i % 400]},
+    }
+
+
+def _gv(obj: dict, tag: str, idx: int = 0):
+    vals = obj.get(tag, {}).get("Value", [])
+    return vals[idx] if idx < len(vals) else ""
+
+
+def _fmt_date(raw: str) -> str:
+    if raw and len(raw) == 8:
+        return f"{raw[:4]}-{raw[4:6]}-{raw[6:8]}"
+    return raw or ""
+
+
+def _loop(studies_raw: list) -> dict:
+    modality_counts: Dict[str, int] = {}
+    date_counts:     Dict[str, int] = {}
+    total_series    = 0
+    total_instances = 0
+    for study in studies_raw:
+        for m in study.get("00080061", {}).get("Value", []):
+            if m:
+                modality_counts[m] = modality_counts.get(m, 0) + 1
+        fmt = _fmt_date(_gv(study, "00080020"))
+        if fmt:
+            date_counts[fmt] = date_counts.get(fmt, 0) + 1
+        try:
+            total_series    += int(study.get("numberOfStudyRelatedSeries")    or _gv(study, "00201206") or 0)
+            total_instances += int(study.get("numberOfStudyRelatedInstances") or _gv(study, "00201208") or 0)
+        except (ValueError, TypeError):
+            pass
+    return {
+        "totalStudies":      len(studies_raw),
+        "totalSeries":       total_series,
+        "totalInstances":    total_instances,
+        "studiesByModality": sorted(
+            [{"modality": k, "count": v} for k, v in modality_counts.items()], key=lambda x: -x["count"],
+        ),
+        "studiesByDate":     [{"date": d, "count": c} for d, c in sorted(date_counts.items())[-30:]],
+    }
+
+
+def _ms(fn, *args):
+    samples = []
+    for _ in range(3):
+        t0  = time.perf_counter()
+        out = fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), out
+
+
+def main() -> None:
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"aggregate backend: {BACKEND} (ms, median of 3 runs)")
+    print(f"  {'studies':>9}{'loop':>10}{'decode':>10}{'aggregate':>11}{'columnar':>10}{'speed-up':>10}")
+    for n in sizes:
+        studies = [_study(i) for i in range(n)]
+        loop_ms, expected = _ms(_loop, studies)
+        decode_ms, columns = _ms(StudyColumns.from_studies, studies)
+        agg_ms, _ = _ms(lambda c: (c.totals(), c.modality_histogram(), c.date_histogram()), columns)
+        assert aggregate_studies(studies) == expected, "columnar result differs from the loop"
+        total = decode_ms + agg_ms
+        print(f"  {n:>9}{loop_ms:10.1f}{decode_ms:10.1f}{agg_ms:11.1f}{total:10.1f}{loop_ms / total:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Peak-RSS benchmark: legacy string-set aggregation vs InstitutionIndex (hashed IdSets).
+
+    python benchmarks/bench_institution_index.py [n_series]
+
+Each variant runs in its own subprocess so ru_maxrss is not shared. Rows are
+generated lazily, so the numbers reflect the aggregation state only.
+"""
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_state import InstitutionIndex, _fmt_date, _gv  # noqa: E402
+
+N_INSTITUTIONS = 12
+
+
+def _series_rows(n: int) -> Iterator[dict]:
+    for i in range(n):
+        study = i // 3
+        yield {
+            "00080080": {"vr": "LO", "Value": [f"Hospital {study % N_INSTITUTIONS}"]},
+            "00080081": {"vr": "ST", "Value": ["Street 1"]},
+            "0020000D": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{study}.{study * 7919}"]},
+            "00100020": {"vr": "LO", "Value": [f"PID{study // 4:010d}"]},
+            "00080060": {"vr": "CS", "Value": [("CT", "MR", "US", "CR")[i % 4]]},
+            "00081040": {"vr": "LO", "Value": [f"Dept {i % 5}"]},
+            "00080021": {"vr": "DA", "Value": [f"20{10 + study % 15:02d}{1 + study % 12:02d}{1 + study % 28:02d}"]},
+        }
+
+
+def _legacy(series_list) -> List[dict]:
+    """The pre-IdSet aggregation: full UID/PatientID strings in sets plus a date list."""
+    buckets: Dict[str, dict] = {}
+    for s in series_list:
+        inst = (_gv(s, "00080080") or "").strip()
+        if not inst:
+            continue
+        b = buckets.setdefault(inst, {
+            "address": _gv(s, "00080081") or "", "study_uids": set(),
+            "patient_ids": set(), "modalities": set(), "departments": set(), "dates": [],
+        })
+        uid  = _gv(s, "0020000D"); uid  and b["study_uids"].add(uid)
+        pid  = _gv(s, "00100020"); pid  and b["patient_ids"].add(pid)
+        mod  = _gv(s, "00080060"); mod  and b["modalities"].add(mod)
+        dept = _gv(s, "00081040"); dept and b["departments"].add(dept)
+        d    = _gv(s, "00080021"); d    and b["dates"].append(d)
+    return [
+        {
+            "id": i + 1, "name": name, "institutionName": name, "address": b["address"],
+            "status": "active", "studyCount": len(b["study_uids"]),
+            "patientCount": len(b["patient_ids"]), "modalities": sorted(b["modalities"]),
+            "departments": sorted(b["departments"]),
+            "lastStudyDate": _fmt_date(max(b["dates"])) if b["dates"] else None,
+        }
+        for i, (name, b) in enumerate(sorted(buckets.items(), key=lambda x: -len(x[1]["study_uids"])))
+    ]
+
+
+def _compact(series_list) -> List[dict]:
+    index = InstitutionIndex()
+    index.add_series(series_list)
+    return index.institutions()
+
+
+def _run(variant: str, n: int) -> None:
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0   = time.perf_counter()
+    out  = (_legacy if variant == "legacy" else _compact)(_series_rows(n))
+    secs = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{variant}\t{(peak - base) / 1024:.1f}\t{secs:.2f}\t{hashlib.md5(repr(out).encode()).hexdigest()}")
+
+
+def main() -> None:
+    if len(sys.argv) > 2:
+        _run(sys.argv[1], int(sys.argv[2]))
+        return
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    results = {}
+    for variant in ("legacy", "compact"):
+        line = subprocess.run(
+            [sys.executable, __file__, variant, str(n)], capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        _, rss, secs, digest = line.split("\t")
+        results[variant] = (float(rss), float(secs), digest)
+        print(f"{variant:8s} {n:>10,} series  peak RSS +{float(rss):8.1f} MiB  {float(secs):6.2f}s")
+    assert results["legacy"][2] == results["compact"][2], "outputs differ"
+    print(f"identical output, peak RSS reduced {results['legacy'][0] / max(results['compact'][0], 0.1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
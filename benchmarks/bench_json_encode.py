@@ -0,0 +1,97 @@
+"""
+Encode-time micro-benchmark: FastAPI's default JSON path vs fast_json.
+
+    python benchmarks/bench_json_encode.py [repeats]
+
+For realistic payloads (1000 DICOM JSON studies, 2000 series, 2000 flattened
+dashboard rows) it times:
+- default:   jsonable_encoder + JSONResponse.render (what FastAPI does with a dict/list)
+- stdlib:    JSONResponse.render alone (json.dumps, no jsonable_encoder)
+- fast_json: FastJSONResponse.render, i.e. what FastJSONRoute does (orjson if installed)
+"""
+import os
+import statistics
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_json import BACKEND, FastJSONResponse  # noqa: E402
+
+
+def _study(i: int) -> dict:
+    return {
+        "00080020": {"vr": "DA", "Value": [f"2024{1 + i % 12:02d}{1 + i % 28:02d}"]},
+        "00080030": {"vr": "TM", "Value": ["101502"]},
+        "00080050": {"vr": "SH", "Value": [f"ACC{i:08d}"]},
+        "00080061": {"vr": "CS", "Value": ["CT", "SR"]},
+        "00080080": {"vr": "LO", "Value": [f"Hospital {i % 12}"]},
+        "00081030": {"vr": "LO", "Value": ["CT CHEST W/O CONTRAST"]},
+        "00100010": {"vr": "PN", "Value": [{"Alphabetic": f"DOE^JOHN^{i}"}]},
+        "00100020": {"vr": "LO", "Value": [f"PID{i // 3:010d}"]},
+        "00100030": {"vr": "DA", "Value": ["19700101"]},
+        "00100040": {"vr": "CS", "Value": ["M"]},
+        "0020000D": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{i}.{i * 7919}"]},
+        "00201206": {"vr": "IS", "Value": [3]},
+        "00201208": {"vr": "IS", "Value": [412]},
+    }
+
+
+def _series(i: int) -> dict:
+    return {
+        "0020000D": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{i // 2}"]},
+        "0020000E": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{i // 2}.{i}"]},
+        "00080060": {"vr": "CS", "Value": [("CT", "MR", "US", "CR")[i % 4]]},
+        "00080021": {"vr": "DA", "Value": ["20240312"]},
+        "0008103E": {"vr": "LO", "Value": ["AX 5mm"]},
+        "00200011": {"vr": "IS", "Value": [i % 9]},
+        "00201209": {"vr": "IS", "Value": [137]},
+    }
+
+
+def _dashboard_row(i: int) -> dict:
+    return {
+        "id": i, "patientName": f"DOE JOHN {i}", "patientId": f"PID{i // 3:010d}",
+        "studyDate": "2024-03-12", "modality": "CT", "description": "CT CHEST",
+        "accessionNumber": f"ACC{i:08d}", "series": 3, "instances": 412,
+        "institution": f"Hospital {i % 12}", "status": "completed",
+    }
+
+
+def _time(fn, payload, repeats: int) -> float:
+    fn(payload)
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(payload)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    repeats  = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    payloads = {
+        "1000 studies":   [_study(i) for i in range(1000)],
+        "2000 series":    [_series(i) for i in range(2000)],
+        "2000 dashboard": {"recentStudies": [_dashboard_row(i) for i in range(2000)]},
+    }
+    default_render = JSONResponse(None).render
+    fast_render    = FastJSONResponse(None).render
+    variants = {
+        "default":   lambda p: default_render(jsonable_encoder(p)),
+        "stdlib":    default_render,
+        "fast_json": fast_render,
+    }
+    print(f"fast_json backend: {BACKEND}, median of {repeats} runs (ms)")
+    print(f"  {'payload':<16}" + "".join(f"{name:>12}" for name in variants) + f"{'speed-up':>11}")
+    for label, payload in payloads.items():
+        ms = {name: _time(fn, payload, repeats) for name, fn in variants.items()}
+        print(f"  {label:<16}" + "".join(f"{ms[name]:12.2f}" for name in variants)
+              + f"{ms['default'] / ms['fast_json']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+CPU / latency benchmark: decoded vs passthrough QIDO proxy responses.
+
+    python benchmarks/bench_qido_passthrough.py [rows] [requests]
+
+Both routes serve the same upstream DICOM JSON body (1000 study rows by default)
+through FastAPI in-process:
+- decoded:     response.json() and FastAPI re-encoding the list (the old proxy path)
+- passthrough: the upstream bytes returned as-is (what _proxy_qido does now)
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+
+def _study(i: int) -> dict:
+    return {
+        "00080005": {"vr": "CS", "Value": ["ISO_IR 100"]},
+        "00080020": {"vr": "DA", "Value": [f"2024{1 + i % 12:02d}{1 + i % 28:02d}"]},
+        "00080030": {"vr": "TM", "Value": ["101502"]},
+        "00080050": {"vr": "SH", "Value": [f"ACC{i:08d}"]},
+        "00080061": {"vr": "CS", "Value": ["CT", "SR"]},
+        "00080080": {"vr": "LO", "Value": [f"Hospital {i % 12}"]},
+        "00081030": {"vr": "LO", "Value": ["CT CHEST W/O CONTRAST"]},
+        "00100010": {"vr": "PN", "Value": [{"Alphabetic": f"DOE^JOHN^{i}"}]},
+        "00100020": {"vr": "LO", "Value": [f"PID{i // 3:010d}"]},
+        "00100030": {"vr": "DA", "Value": ["19700101"]},
+        "00100040": {"vr": "CS", "Value": ["M"]},
+        "0020000D": {"vr": "UI", "Value": [f"1.2.826.0.1.3680043.8.498.{i}.{i * 7919}"]},
+        "00201206": {"vr": "IS", "Value": [3]},
+        "00201208": {"vr": "IS", "Value": [412]},
+        "00081190": {"vr": "UR", "Value": [f"http://pacs:8080/dcm4chee-arc/aets/DCM4CHEE/rs/studies/1.2.{i}"]},
+    }
+
+
+def _app(body: bytes) -> FastAPI:
+    upstream = httpx.Response(200, content=body, headers={"content-type": "application/dicom+json"})
+    app = FastAPI()
+
+    @app.get("/decoded")
+    async def decoded():
+        return upstream.json()
+
+    @app.get("/passthrough")
+    async def passthrough():
+        return Response(content=upstream.content, media_type=upstream.headers["content-type"])
+
+    return app
+
+
+async def _run(api: httpx.AsyncClient, path: str, n: int) -> dict:
+    await api.get(path)  # warm-up
+    latencies = []
+    cpu0 = time.process_time()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r  = await api.get(path)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert r.status_code == 200
+    cpu = (time.process_time() - cpu0) * 1000 / n
+    latencies.sort()
+    return {
+        "cpu_ms": cpu,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n    = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    body = json.dumps([_study(i) for i in range(rows)]).encode()
+    api  = httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(body)), base_url="http://bench")
+
+    print(f"{rows} rows, {len(body) / 1024:.0f} KiB body, {n} requests each")
+    results = {path: await _run(api, f"/{path}", n) for path in ("decoded", "passthrough")}
+    for path, r in results.items():
+        print(f"  {path:<12} cpu {r['cpu_ms']:7.2f} ms/req   p50 {r['p50_ms']:7.2f} ms   p95 {r['p95_ms']:7.2f} ms")
+    d, p = results["decoded"], results["passthrough"]
+    print(f"  speed-up: {d['cpu_ms'] / p['cpu_ms']:.1f}x CPU, {d['p50_ms'] / p['p50_ms']:.1f}x p50 latency")
+    await api.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Compact projection of QIDO DICOM JSON (?format=compact).
+
+Rows are reduced to the requested fields and flattened: {"vr", "Value": [...]}
+becomes the value itself (a list only if there are several values, or for
+multi-valued fields such as ModalitiesInStudy), person names become their
+Alphabetic string and sequence fields read the first item. layout=columns
+returns one array per field instead of one object per row.
+
+Fields are given by DICOM keyword (or the camelCase output name) from FIELDS,
+or as a raw tag ("00080020") / tag path ("00400100.00400002").
+"""
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Backend-only query params of the compact mode, never forwarded to dcm4chee.
+FORMAT_PARAMS = ("format", "fields", "layout")
+
+# keyword -> (tag path, always a list)
+FIELDS: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+    "StudyInstanceUID":                  (("0020000D",), False),
+    "SeriesInstanceUID":                 (("0020000E",), False),
+    "StudyDate":                         (("00080020",), False),
+    "StudyTime":                         (("00080030",), False),
+    "SeriesDate":                        (("00080021",), False),
+    "AccessionNumber":                   (("00080050",), False),
+    "Modality":                          (("00080060",), False),
+    "ModalitiesInStudy":                 (("00080061",), True),
+    "InstitutionName":                   (("00080080",), False),
+    "ReferringPhysicianName":            (("00080090",), False),
+    "StudyDescription":                  (("00081030",), False),
+    "SeriesDescription":                 (("0008103E",), False),
+    "InstitutionalDepartmentName":       (("00081040",), False),
+    "PatientName":                       (("00100010",), False),
+    "PatientID":                         (("00100020",), False),
+    "PatientBirthDate":                  (("00100030",), False),
+    "PatientSex":                        (("00100040",), False),
+    "BodyPartExamined":                  (("00180015",), False),
+    "StudyID":                           (("00200010",), False),
+    "SeriesNumber":                      (("00200011",), False),
+    "NumberOfPatientRelatedStudies":     (("00201200",), False),
+    "NumberOfStudyRelatedSeries":        (("00201206",), False),
+    "NumberOfStudyRelatedInstances":     (("00201208",), False),
+    "NumberOfSeriesRelatedInstances":    (("00201209",), False),
+    "RequestedProcedureDescription":     (("00321060",), False),
+    "RequestedProcedureID":              (("00401001",), False),
+    "ScheduledStationAETitle":           (("00400100", "00400001"), False),
+    "ScheduledProcedureStepStartDate":   (("00400100", "00400002"), False),
+    "ScheduledProcedureStepStartTime":   (("00400100", "00400003"), False),
+    "ScheduledProcedureStepDescription": (("00400100", "00400007"), False),
+    "ScheduledProcedureStepID":          (("00400100", "00400009"), False),
+    "ScheduledModality":                 (("00400100", "00080060"), False),
+}
+
+DEFAULT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "studies": (
+        "StudyInstanceUID", "StudyDate", "StudyTime", "AccessionNumber", "ModalitiesInStudy",
+        "StudyDescription", "PatientName", "PatientID", "InstitutionName",
+        "NumberOfStudyRelatedSeries", "NumberOfStudyRelatedInstances",
+    ),
+    "series": (
+        "StudyInstanceUID", "SeriesInstanceUID", "Modality", "SeriesNumber", "SeriesDate",
+        "SeriesDescription", "BodyPartExamined", "NumberOfSeriesRelatedInstances",
+    ),
+    "patients": (
+        "PatientID", "PatientName", "PatientBirthDate", "PatientSex", "NumberOfPatientRelatedStudies",
+    ),
+    "mwlitems": (
+        "AccessionNumber", "PatientName", "PatientID", "PatientBirthDate", "PatientSex",
+        "RequestedProcedureDescription", "ScheduledModality", "ScheduledStationAETitle",
+        "ScheduledProcedureStepStartDate", "ScheduledProcedureStepStartTime", "StudyInstanceUID",
+    ),
+}
+
+_BY_NAME = {**{k.lower(): k for k in FIELDS}, **{(k[0].lower() + k[1:]).lower(): k for k in FIELDS}}
+
+Field = Tuple[str, Tuple[str, ...], bool]  # output name, tag path, always a list
+
+
+def _flat(attr: Optional[dict], multi: bool):
+    values = (attr or {}).get("Value") or []
+    values = [v.get("Alphabetic", "") if isinstance(v, dict) and "Alphabetic" in v else v for v in values]
+    if multi:
+        return values
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def _lookup(row: dict, path: Tuple[str, ...], multi: bool):
+    for tag in path[:-1]:
+        items = (row.get(tag) or {}).get("Value") or []
+        row = items[0] if items and isinstance(items[0], dict) else {}
+    return _flat(row.get(path[-1]), multi)
+
+
+class CompactSpec:
+    def __init__(self, fields: List[Field], layout: str) -> None:
+        self.fields = fields
+        self.layout = layout
+
+    def includefields(self) -> List[str]:
+        """Top-level tags to request from dcm4chee so every projected field is returned."""
+        return sorted({path[0] for _, path, _ in self.fields})
+
+    def row(self, row: dict) -> dict:
+        return {name: _lookup(row, path, multi) for name, path, multi in self.fields}
+
+    def render(self, rows: list):
+        if self.layout == "columns":
+            return {
+                "count":   len(rows),
+                "columns": {name: [_lookup(r, path, multi) for r in rows] for name, path, multi in self.fields},
+            }
+        return [self.row(r) for r in rows]
+
+
+def compact_spec(resource: str, fmt: str, fields: str = "", layout: str = "") -> Optional[CompactSpec]:
+    """CompactSpec for ?format=compact, None for the default DICOM JSON. Raises 400 on bad params."""
+    if fmt in ("", "dicom"):
+        return None
+    if fmt != "compact":
+        raise HTTPException(status_code=400, detail="format must be 'dicom' or 'compact'")
+    if layout not in ("", "rows", "columns"):
+        raise HTTPException(status_code=400, detail="layout must be 'rows' or 'columns'")
+    names = [f.strip() for f in fields.split(",") if f.strip()] or list(DEFAULT_FIELDS.get(resource, ()))
+    spec: List[Field] = []
+    for name in names:
+        keyword = _BY_NAME.get(name.lower())
+        if keyword:
+            path, multi = FIELDS[keyword]
+            spec.append((keyword[0].lower() + keyword[1:], path, multi))
+            continue
+        path = tuple(name.upper().split("."))
+        if not all(len(t) == 8 and all(c in "0123456789ABCDEF" for c in t) for t in path):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+        spec.append((name.upper(), path, False))
+    return CompactSpec(spec, layout or "rows")
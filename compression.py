@@ -0,0 +1,196 @@
+"""
+Negotiated response compression (zstd, br, gzip) for the API.
+
+CompressionMiddleware is a plain ASGI middleware rather than a Starlette
+BaseHTTPMiddleware, so streamed responses (e.g. /api/patients?stream=ndjson)
+are compressed chunk by chunk and flushed as each chunk is sent. Whole bodies
+below the size threshold, already encoded bodies and event streams are sent
+as they are. brotli and zstd need the optional `brotli` / `zstandard` packages;
+without them those encodings are simply not offered.
+"""
+import zlib
+from typing import Dict, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Server preference when the client accepts several encodings with the same q.
+PREFERENCE = ("zstd", "br", "gzip")
+
+# Exposed through /api/debug/metrics.
+compression_stats: Dict = {
+    "responses": 0, "bytesIn": 0, "bytesOut": 0, "byEncoding": {},
+    "upstream": {"responses": 0, "wireBytes": 0, "decodedBytes": 0},
+}
+
+
+class _Gzip:
+    def __init__(self, level: int) -> None:
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, level: int) -> None:
+        self._c = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int) -> None:
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce, in server preference order."""
+    have = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [enc for enc in PREFERENCE if have[enc]]
+
+
+def negotiate(accept_encoding: str, offered: List[str]) -> Optional[str]:
+    """Best offered encoding for an Accept-Encoding header, or None for identity."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for enc in offered:
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def record_upstream(wire_bytes: int, decoded_bytes: int) -> None:
+    """Count one upstream body: bytes on the wire vs after httpx decompressed it."""
+    up = compression_stats["upstream"]
+    up["responses"]    += 1
+    up["wireBytes"]    += wire_bytes
+    up["decodedBytes"] += decoded_bytes
+
+
+def stats_dict() -> dict:
+    up = compression_stats["upstream"]
+    return {
+        **compression_stats,
+        "bytesSaved": compression_stats["bytesIn"] - compression_stats["bytesOut"],
+        "upstream":   {**up, "bytesSaved": up["decodedBytes"] - up["wireBytes"]},
+    }
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, levels: Optional[Dict[str, int]] = None) -> None:
+        self.app          = app
+        self.minimum_size = minimum_size
+        self.levels       = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.offered      = available_encodings()
+
+    def _coder(self, encoding: str):
+        cls = {"gzip": _Gzip, "br": _Brotli, "zstd": _Zstd}[encoding]
+        return cls(self.levels[encoding])
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        encoding = negotiate(accept, self.offered) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        coder = None
+        passthrough = False
+
+        async def _send(message: dict) -> None:
+            nonlocal start, coder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                passthrough = (
+                    message["status"] in (204, 304)
+                    or b"content-encoding" in headers
+                    or headers.get(b"content-type", b"").startswith(b"text/event-stream")
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if coder is None:
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                coder   = self._coder(encoding)
+                headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+                if not more:
+                    out = coder.compress(body) + coder.finish()
+                    headers.append((b"content-length", str(len(out)).encode()))
+                    await send({**start, "headers": headers})
+                    self._count(encoding, len(body), len(out), done=True)
+                    await send({"type": "http.response.body", "body": out})
+                    return
+                await send({**start, "headers": headers})
+            out = coder.compress(body) + (coder.flush() if more else coder.finish())
+            self._count(encoding, len(body), len(out), done=not more)
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, _send)
+
+    @staticmethod
+    def _count(encoding: str, size_in: int, size_out: int, done: bool) -> None:
+        compression_stats["bytesIn"]  += size_in
+        compression_stats["bytesOut"] += size_out
+        if done:
+            compression_stats["responses"] += 1
+            by = compression_stats["byEncoding"]
+            by[encoding] = by.get(encoding, 0) + 1
@@ -0,0 +1,260 @@
+"""
+Windowed, concurrent QIDO crawler used for every bulk fetch.
+
+Instead of walking limit/offset over the whole result set, the keyspace is split
+into windows on a date or datetime attribute (StudyReceiveDateTime by default,
+which every study and series carries). Windows are fetched concurrently; a
+bounded window is first sized with a QIDO …/count query, halved while it holds
+more than a page until it reaches the attribute's granularity, and skipped when
+empty. Open-ended windows, and windows that cannot be split further, are paged
+with offsets.
+
+Page bodies are decoded incrementally from the response stream, one object at a
+time, keeping only the requested tags; crawl_pages hands accepted pages to the
+caller as they arrive. A page holds one of `concurrency` slots from before its
+request until the caller takes it, so however many windows are open and however
+slow the caller, at most `concurrency` pages are in flight or waiting.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Collection, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+Window = Tuple[Optional[datetime], Optional[datetime]]
+
+_decoder = json.JSONDecoder()
+_SKIP    = " \t\n\r,"
+
+# Last crawl stats per crawl name, exposed through /api/debug/metrics.
+crawl_stats: Dict[str, dict] = {}
+
+
+class CrawlStats:
+    def __init__(self, name: str) -> None:
+        self.name    = name
+        self.pages   = 0
+        self.rows    = 0
+        self.splits  = 0
+        self.counts  = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed or (time.monotonic() - self.started)
+        return {
+            "pages":        self.pages,
+            "rows":         self.rows,
+            "splits":       self.splits,
+            "countQueries": self.counts,
+            "seconds":      round(elapsed, 3),
+            "pagesPerSec":  round(self.pages / elapsed, 1) if elapsed else 0.0,
+            "rowsPerSec":   round(self.rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def _granularity(attr: str) -> Tuple[str, timedelta]:
+    """DICOM format and smallest step for a DA (…Date) or DT (…DateTime) attribute."""
+    if attr.endswith("Date"):
+        return "%Y%m%d", timedelta(days=1)
+    return "%Y%m%d%H%M%S", timedelta(seconds=1)
+
+
+def initial_windows(
+    attr: str, start: datetime, end: datetime, window_days: int,
+    open_start: bool = True,
+) -> List[Window]:
+    """
+    Cover the whole keyspace: an open window before start (unless start is a
+    delta watermark), fixed-size windows up to end, and an open window after.
+    """
+    _, step = _granularity(attr)
+    windows: List[Window] = [(None, start - step)] if open_start else []
+    lo = start
+    while lo <= end:
+        hi = min(lo + timedelta(days=window_days) - step, end)
+        windows.append((lo, hi))
+        lo = hi + step
+    windows.append((end + step, None))
+    return windows
+
+
+async def iter_json_array(
+    chunks: AsyncIterator[str], keep: Optional[Collection[str]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Yield the objects of a streamed top-level JSON array one at a time.
+
+    Only the tags in keep are retained (all of them if keep is None). At most one
+    partially received object is buffered between chunks.
+    """
+    buf, pos, started = "", 0, False
+    async for chunk in chunks:
+        buf, pos = buf[pos:] + chunk, 0
+        n = len(buf)
+        while True:
+            while pos < n and buf[pos] in _SKIP:
+                pos += 1
+            if pos >= n:
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # object continues in the next chunk
+            yield obj if keep is None else {k: obj[k] for k in keep if k in obj}
+    if buf[pos:].strip():
+        raise ValueError("truncated JSON array")
+
+
+async def crawl_pages(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    query: str = "",
+    *,
+    name: str = "crawl",
+    window_attr: Optional[str] = None,
+    windows: Optional[List[Window]] = None,
+    page_size: int = 1000,
+    concurrency: int = 4,
+    keep: Optional[Collection[str]] = None,
+) -> AsyncIterator[list]:
+    """
+    Yield every row of a QIDO resource, one page (list of rows) at a time.
+
+    query is an already encoded query string (without limit/offset). Without
+    window_attr the crawl is a single window paged with offsets, several pages
+    at a time. Pages are yielded in arrival order; fetching and waiting pages
+    together never exceed `concurrency`, so no page is requested while that many
+    are waiting for the consumer. Raises HTTPException on any upstream status
+    other than 200/204.
+    """
+    fmt, step = _granularity(window_attr or "")
+    slots     = asyncio.Semaphore(concurrency)  # freed when the consumer takes a page
+    queue     = asyncio.Queue()                 # bounded by slots
+    stats     = CrawlStats(name)
+    base      = f"{url}?{query}&" if query else f"{url}?"
+
+    def _range(win: Window) -> str:
+        lo, hi = win
+        if not window_attr or (lo is None and hi is None):
+            return ""
+        return (f"&{window_attr}="
+                f"{lo.strftime(fmt) if lo else ''}-{hi.strftime(fmt) if hi else ''}")
+
+    async def _page(win: Window, offset: int) -> list:
+        """Fetch one page into a slot; the caller passes the page (and slot) to _emit."""
+        await slots.acquire()
+        try:
+            async with client.stream(
+                "GET", f"{base}limit={page_size}&offset={offset}{_range(win)}", headers=headers,
+            ) as resp:
+                if resp.status_code == 204:
+                    return []
+                if resp.status_code != 200:
+                    await resp.aread()
+                    raise HTTPException(status_code=resp.status_code, detail=resp.text)
+                page = [row async for row in iter_json_array(resp.aiter_text(), keep)]
+        except BaseException:
+            slots.release()
+            raise
+        return page
+
+    async def _count(win: Window) -> int:
+        """Rows in a window, from dcm4chee's …/count (no rows are transferred)."""
+        params = "&".join(p for p in (query, _range(win)[1:]) if p)
+        async with slots:
+            resp = await client.get(f"{url}/count?{params}", headers={**headers, "Accept": "application/json"})
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        stats.counts += 1
+        return int(resp.json()["count"])
+
+    def _emit(page: list) -> int:
+        """Queue a fetched page for the consumer (an empty one frees its slot now)."""
+        if page:
+            queue.put_nowait(page)
+        else:
+            slots.release()
+        return len(page)
+
+    async def _paged(win: Window, offset: int) -> int:
+        return _emit(await _page(win, offset))
+
+    def _taken(page: list) -> list:
+        slots.release()
+        stats.pages += 1
+        stats.rows  += len(page)
+        return page
+
+    tasks: set = set()
+
+    def _spawn(win: Window) -> asyncio.Future:
+        task = asyncio.ensure_future(_window(win))
+        tasks.add(task)
+        return task
+
+    async def _window(win: Window) -> None:
+        lo, hi = win
+        if window_attr and lo is not None and hi is not None:
+            rows = await _count(win)
+            if rows == 0:
+                return
+            if rows > page_size and hi > lo:
+                mid = lo + (hi - lo) / 2
+                mid = datetime.strptime(mid.strftime(fmt), fmt)
+                stats.splits += 1
+                await asyncio.gather(_spawn((lo, mid)), _spawn((mid + step, hi)))
+                return
+        if await _paged(win, 0) < page_size:
+            return
+        # Open-ended, unsplittable or grown since its count: page the rest with offsets,
+        # `concurrency` pages at a time. Each page is queued as soon as it arrives,
+        # never held for the rest of its batch.
+        offset = page_size
+        while True:
+            sizes = await asyncio.gather(*[
+                _paged(win, offset + i * page_size) for i in range(concurrency)
+            ])
+            if min(sizes) < page_size:
+                return
+            offset += concurrency * page_size
+
+    producer = asyncio.ensure_future(
+        asyncio.gather(*[_spawn(w) for w in (windows or [(None, None)])])
+    )
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield _taken(getter.result())
+                continue
+            getter.cancel()
+            while not queue.empty():
+                yield _taken(queue.get_nowait())
+            producer.result()  # re-raise upstream errors
+            break
+    finally:
+        for task in (producer, *tasks):
+            task.cancel()
+        stats.elapsed = time.monotonic() - stats.started
+        crawl_stats[name] = stats.as_dict()
+    s = crawl_stats[name]
+    print(f"[crawler] {name}: {s['pages']} pages, {s['rows']} rows in {s['seconds']}s "
+          f"({s['pagesPerSec']} pages/s, {s['rowsPerSec']} rows/s, {s['splits']} splits)")
+
+
+async def crawl(client: httpx.AsyncClient, url: str, headers: dict, query: str = "", **kwargs) -> list:
+    """crawl_pages collected into one list, for callers that need every row at once."""
+    return [row async for page in crawl_pages(client, url, headers, query, **kwargs) for row in page]
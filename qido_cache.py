@@ -0,0 +1,116 @@
+"""
+Request coalescing and response caching for the read-only QIDO proxy endpoints.
+
+Both are keyed on (webAppService, resource, cleaned query string):
+- Coalescer: identical concurrent queries share one upstream call; its result,
+  or its exception, is handed to every waiter
+- ResponseCache: LRU/TTL cache with a total byte budget and explicit invalidation
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def normalize_query(query_string: str) -> str:
+    """Order-independent form of an encoded query string, for use in cache keys."""
+    return "&".join(sorted(p for p in query_string.split("&") if p))
+
+
+class Coalescer:
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda t: self._inflight.get(key) is t and self._inflight.pop(key))
+        else:
+            self.stats["coalesced"] += 1
+        # shield: one waiter disconnecting must not cancel the call the others share
+        return await asyncio.shield(task)
+
+    def as_dict(self) -> dict:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "inflight": len(self._inflight),
+            "coalescedRatio": round(self.stats["coalesced"] / total, 3) if total else 0.0,
+        }
+
+
+class ResponseCache:
+    """
+    LRU cache with per-entry TTL and a total byte budget. Values are opaque: the
+    QIDO proxy stores raw upstream (body bytes, content-type) tuples, the dashboard
+    count cache plain ints.
+
+    Sizes are the upstream body lengths, given by the caller. Expired entries stay
+    until evicted or replaced so they can still be served while dcm4chee is unavailable.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes     = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self.stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "expired": 0, "evictions": 0,
+            "invalidations": 0, "staleServed": 0,
+        }
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """(True, value) for a fresh entry, else (False, None)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return False, None
+        if time.monotonic() >= entry[0]:
+            self.stats["expired"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return True, entry[2]
+
+    def get_stale(self, key: Hashable) -> Tuple[bool, Any]:
+        """Any entry for key, expired or not — for use when upstream is down."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        self.stats["staleServed"] += 1
+        return True, entry[2]
+
+    def put(self, key: Hashable, value: Any, size: int, ttl: float) -> None:
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Drop every entry whose key satisfies match (all entries if None)."""
+        keys = [k for k in self._entries if match is None or match(k)]
+        for k in keys:
+            self._drop(k)
+        self.stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def as_dict(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["expired"]
+        return {
+            **self.stats,
+            "entries":  len(self._entries),
+            "bytes":    self.bytes,
+            "maxBytes": self.max_bytes,
+            "hitRatio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
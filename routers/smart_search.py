@@ -23,8 +23,9 @@ from app_state import (
     _fmt_date,
     _gv,
 )
+from fast_json import FastJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 genai.configure(api_key=GEMINI_API_KEY)
 
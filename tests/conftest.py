@@ -0,0 +1,64 @@
+"""
+Shared test setup. The backend modules read their configuration at import time,
+so the SQLite paths are pointed at a throwaway directory before anything imports
+app_state / app.
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="curalink-tests-")
+os.environ.setdefault("CURALINK_DB_PATH", os.path.join(_TMP, "curalink_users.db"))
+os.environ.setdefault("CURALINK_INDEX_DB_PATH", os.path.join(_TMP, "curalink_index.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def dcm4chee(monkeypatch):
+    """
+    Route every upstream call of the backend to a handler: dcm4chee(handler) installs
+    it and returns the list of requests seen, each tagged with the lane it used in
+    request.extensions["lane"] ("interactive" or "background"). Tokens are stubbed out.
+    """
+    import app
+    import app_state
+
+    seen = []
+
+    def install(handler):
+        def lane(name):
+            def record(request):
+                request.extensions["lane"] = name
+                seen.append(request)
+                return handler(request)
+            return httpx.AsyncClient(transport=httpx.MockTransport(record))
+
+        interactive, background = lane("interactive"), lane("background")
+        for module in (app, app_state):
+            monkeypatch.setattr(module, "client", interactive)
+            monkeypatch.setattr(module, "background_client", background)
+            monkeypatch.setattr(module, "get_token", _token)
+        return seen
+
+    return install
+
+
+async def _token() -> str:
+    return "t"
+
+
+def api(method: str, path: str, **kwargs) -> httpx.Response:
+    """Call the FastAPI app in-process (startup hooks are not run)."""
+    import asyncio
+
+    import app
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://test") as c:
+            return await c.request(method, path, **kwargs)
+
+    return asyncio.run(run())
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import aggregate
+from aggregate import aggregate_studies
+from benchmarks.bench_dashboard_aggregate import _loop, _study
+
+
+def _odd_study(rng: random.Random, i: int) -> dict:
+    """A study row with the irregularities QIDO results really have."""
+    s = _study(i)
+    roll = rng.random()
+    if roll < 0.1:
+        del s["00080020"]                                   # no StudyDate
+    elif roll < 0.2:
+        s["00080020"] = {"vr": "DA"}                        # present, no value
+    elif roll < 0.25:
+        s["00080020"]["Value"] = ["2024"]                   # not YYYYMMDD
+    roll = rng.random()
+    if roll < 0.1:
+        s["00080061"] = {"vr": "CS", "Value": ["", "CT"]}   # empty modality
+    elif roll < 0.2:
+        del s["00080061"]
+    roll = rng.random()
+    if roll < 0.1:
+        s["00201206"]["Value"] = ["3"]                      # IS as a string
+        s["00201208"]["Value"] = ["120"]
+    elif roll < 0.15:
+        s["00201206"]["Value"] = ["x"]                      # bad series count drops both
+    elif roll < 0.2:
+        s["00201208"]["Value"] = ["y"]                      # bad instance count drops its own
+    elif roll < 0.25:
+        s["numberOfStudyRelatedSeries"] = 9                 # top-level counts win
+        s["numberOfStudyRelatedInstances"] = 90
+    elif roll < 0.3:
+        del s["00201206"], s["00201208"]
+    return s
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_the_per_study_loop(seed):
+    rng     = random.Random(seed)
+    studies = [_odd_study(rng, i) for i in range(2000)]
+    assert aggregate_studies(studies) == _loop(studies)
+
+
+def test_empty_input():
+    assert aggregate_studies([]) == _loop([])
+
+
+def test_modality_ties_keep_first_appearance():
+    studies = [{"00080061": {"Value": [m]}} for m in ("MR", "CT", "CT", "MR", "US")]
+    assert [m["modality"] for m in aggregate_studies(studies)["studiesByModality"]] == ["MR", "CT", "US"]
+
+
+def test_python_backend_matches(monkeypatch):
+    monkeypatch.setattr(aggregate, "np", None)
+    studies = [_odd_study(random.Random(7), i) for i in range(500)]
+    assert aggregate_studies(studies) == _loop(studies)
@@ -0,0 +1,66 @@
+import pytest
+from fastapi import HTTPException
+
+from compact import DEFAULT_FIELDS, compact_spec
+
+STUDY = {
+    "0020000D": {"vr": "UI", "Value": ["1.2.3"]},
+    "00080061": {"vr": "CS", "Value": ["CT"]},
+    "00100010": {"vr": "PN", "Value": [{"Alphabetic": "DOE^JANE"}]},
+    "00080050": {"vr": "SH"},
+    "00201208": {"vr": "IS", "Value": [12, 13]},
+}
+MWL = {
+    "00400100": {"vr": "SQ", "Value": [{
+        "00400002": {"vr": "DA", "Value": ["20240105"]},
+        "00080060": {"vr": "CS", "Value": ["MR"]},
+    }]},
+}
+
+
+def test_dicom_format_is_not_projected():
+    assert compact_spec("studies", "") is None
+    assert compact_spec("studies", "dicom") is None
+
+
+def test_values_are_flattened():
+    spec = compact_spec("studies", "compact",
+                        "StudyInstanceUID,modalitiesInStudy,PatientName,AccessionNumber,00201208")
+    assert spec.row(STUDY) == {
+        "studyInstanceUID":  "1.2.3",
+        "modalitiesInStudy": ["CT"],      # multi-valued field: always a list
+        "patientName":       "DOE^JANE",  # PN -> Alphabetic
+        "accessionNumber":   None,        # present without a value
+        "00201208":          [12, 13],    # several values stay a list
+    }
+
+
+def test_sequence_paths_read_the_first_item():
+    spec = compact_spec("mwlitems", "compact", "ScheduledProcedureStepStartDate,00400100.00080060,PatientID")
+    assert spec.row(MWL) == {"scheduledProcedureStepStartDate": "20240105", "00400100.00080060": "MR",
+                             "patientID": None}
+    assert spec.includefields() == ["00100020", "00400100"]
+
+
+def test_columns_layout():
+    spec = compact_spec("studies", "compact", "StudyInstanceUID,ModalitiesInStudy", "columns")
+    assert spec.render([STUDY, {}]) == {
+        "count": 2, "columns": {"studyInstanceUID": ["1.2.3", None], "modalitiesInStudy": [["CT"], []]},
+    }
+    assert spec.render([]) == {"count": 0, "columns": {"studyInstanceUID": [], "modalitiesInStudy": []}}
+
+
+@pytest.mark.parametrize("resource", sorted(DEFAULT_FIELDS))
+def test_default_fields_per_resource(resource):
+    spec = compact_spec(resource, "compact")
+    assert len(spec.fields) == len(DEFAULT_FIELDS[resource])
+    assert spec.layout == "rows"
+
+
+@pytest.mark.parametrize("fmt, fields, layout", [
+    ("xml", "", ""), ("compact", "", "table"), ("compact", "NoSuchField", ""), ("compact", "0008002", ""),
+])
+def test_bad_params_are_a_400(fmt, fields, layout):
+    with pytest.raises(HTTPException) as exc:
+        compact_spec("studies", fmt, fields, layout)
+    assert exc.value.status_code == 400
@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+
+from compression import CompressionMiddleware, negotiate
+
+BIG = b'{"rows":"' + b"x" * 4000 + b'"}'
+
+
+@pytest.mark.parametrize("header, offered, expected", [
+    ("gzip, br", ["zstd", "br", "gzip"], "br"),                 # server preference on equal q
+    ("gzip;q=1.0, br;q=0.5", ["zstd", "br", "gzip"], "gzip"),
+    ("br;q=0, gzip", ["br", "gzip"], "gzip"),                  # q=0 refuses
+    ("*", ["br", "gzip"], "br"),
+    ("identity", ["gzip"], None),
+    ("gzip;q=oops", ["gzip"], None),
+    ("zstd", ["br", "gzip"], None),                            # not available here
+])
+def test_negotiate(header, offered, expected):
+    assert negotiate(header, offered) == expected
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return Response(BIG, media_type="application/json")
+
+    @app.get("/small")
+    async def small():
+        return Response(b"[]", media_type="application/json")
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(3):
+                yield b'{"n":%d}\n' % i
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    @app.get("/events")
+    async def events():
+        async def ticks():
+            yield b"event: ping\n\n"
+        return StreamingResponse(ticks(), media_type="text/event-stream")
+
+    @app.get("/not-modified")
+    async def not_modified():
+        return Response(status_code=304)
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return app
+
+
+def _get(path: str, accept: str = "gzip") -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            resp = await c.get(path, headers={"Accept-Encoding": accept})
+            return resp, await resp.aread()
+    return asyncio.run(run())
+
+
+def test_large_body_is_compressed_with_vary_and_length():
+    resp, body = _get("/big")
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert int(resp.headers["content-length"]) < len(BIG)
+    assert body == BIG  # httpx decoded it
+
+
+def test_streamed_body_is_compressed_chunk_by_chunk():
+    resp, body = _get("/stream")
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "content-length" not in resp.headers
+    assert body == b'{"n":0}\n{"n":1}\n{"n":2}\n'
+
+
+@pytest.mark.parametrize("path, accept", [
+    ("/small", "gzip"), ("/events", "gzip"), ("/not-modified", "gzip"), ("/big", "identity"),
+])
+def test_passthrough(path, accept):
+    resp, _ = _get(path, accept)
+    assert "content-encoding" not in resp.headers
+
+
+def test_gzip_output_is_a_valid_gzip_stream():
+    async def run():
+        raw = []
+
+        async def send(message):
+            raw.append(message)
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        scope = {"type": "http", "method": "GET", "path": "/big", "raw_path": b"/big", "query_string": b"",
+                 "headers": [(b"accept-encoding", b"gzip")], "root_path": "", "scheme": "http",
+                 "server": ("test", 80), "client": ("test", 1), "http_version": "1.1"}
+        await CompressionMiddleware(_app_plain(), minimum_size=10)(scope, receive, send)
+        return b"".join(m.get("body", b"") for m in raw if m["type"] == "http.response.body")
+
+    assert gzip.decompress(asyncio.run(run())) == BIG
+
+
+def _app_plain():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(BIG)).encode())]})
+        await send({"type": "http.response.body", "body": BIG[:100], "more_body": True})
+        await send({"type": "http.response.body", "body": BIG[100:]})
+    return app
@@ -0,0 +1,140 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from crawler import crawl_pages, crawl_stats, initial_windows, iter_json_array
+
+ROWS = [
+    {"0020000D": {"vr": "UI", "Value": ["1.2.3"]}, "00080050": {"vr": "SH", "Value": ["A, [1]"]}},
+    {"0020000D": {"vr": "UI", "Value": ["1.2.4"]}, "00080050": {"vr": "SH", "Value": ["B}"]}},
+    {},
+]
+BODY = "[\n " + ",\n ".join(json.dumps(r) for r in ROWS) + "\n]\n"
+
+
+async def _chunks(*parts):
+    for p in parts:
+        yield p
+
+
+def _collect(*parts, keep=None) -> list:
+    async def run():
+        return [obj async for obj in iter_json_array(_chunks(*parts), keep)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("cut", range(len(BODY) + 1))
+def test_any_chunk_boundary(cut):
+    assert _collect(BODY[:cut], BODY[cut:]) == ROWS
+
+
+def test_one_character_chunks():
+    assert _collect(*BODY) == ROWS
+
+
+def test_keep_drops_other_tags():
+    assert _collect(BODY, keep=("0020000D",)) == [
+        {"0020000D": {"vr": "UI", "Value": ["1.2.3"]}},
+        {"0020000D": {"vr": "UI", "Value": ["1.2.4"]}},
+        {},
+    ]
+
+
+def test_empty_array():
+    assert _collect("[", " ]") == []
+
+
+@pytest.mark.parametrize("parts", [(BODY[:-10],), ('{"a": 1}',)])
+def test_truncated_or_non_array_body_raises(parts):
+    with pytest.raises(ValueError):
+        _collect(*parts)
+
+
+class _Archive:
+    """QIDO stub: `rows` rows in every window; records how many pages are undelivered."""
+
+    def __init__(self, rows: int) -> None:
+        self.rows    = rows
+        self.fetched = 0
+        self.taken   = 0
+        self.peak    = 0
+
+    def handler(self, request):
+        if request.url.path.endswith("/count"):
+            return httpx.Response(200, json={"count": self.rows})
+        self.fetched += 1
+        self.peak = max(self.peak, self.fetched - self.taken)
+        offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+        page = [{"n": i} for i in range(offset, min(offset + limit, self.rows))]
+        return httpx.Response(200, json=page) if page else httpx.Response(204)
+
+    def crawl(self, **kwargs) -> list:
+        async def run():
+            pages = []
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self.handler)) as client:
+                async for page in crawl_pages(client, "http://pacs/studies", {}, **kwargs):
+                    self.taken += 1
+                    pages.append(page)
+                    await asyncio.sleep(0.001)  # a slow consumer, like the index feed
+            return pages
+        return asyncio.run(run())
+
+
+def test_pages_waiting_for_a_slow_consumer_are_bounded_across_windows():
+    day     = timedelta(days=1)
+    windows = [(datetime(2024, 1, 1) + i * day, datetime(2024, 1, 1) + i * day) for i in range(60)]
+    archive = _Archive(rows=1)
+    pages   = archive.crawl(window_attr="StudyReceiveDateTime", windows=windows, page_size=10, concurrency=3)
+    assert len(pages) == 60
+    assert archive.peak <= 3
+
+
+def test_offset_paging_is_bounded_and_complete():
+    archive = _Archive(rows=95)
+    pages   = archive.crawl(page_size=2, concurrency=3)
+    assert sorted(row["n"] for page in pages for row in page) == list(range(95))
+    assert archive.peak <= 3
+
+
+class _DatedArchive:
+    """QIDO stub over rows with a StudyReceiveDateTime, honouring range, count and paging."""
+
+    def __init__(self, times: list) -> None:
+        self.times       = sorted(t.strftime("%Y%m%d%H%M%S") for t in times)
+        self.transferred = 0
+
+    def _matching(self, request) -> list:
+        lo, _, hi = request.url.params.get("StudyReceiveDateTime", "-").partition("-")
+        return [t for t in self.times if (not lo or t >= lo) and (not hi or t <= hi)]
+
+    def handler(self, request):
+        rows = self._matching(request)
+        if request.url.path.endswith("/count"):
+            return httpx.Response(200, json={"count": len(rows)})
+        offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+        page = [{"t": t} for t in rows[offset:offset + limit]]
+        self.transferred += len(page)
+        return httpx.Response(200, json=page) if page else httpx.Response(204)
+
+
+def test_splits_are_decided_by_count_and_download_each_row_once():
+    start   = datetime(2024, 1, 1)
+    times   = [start + timedelta(minutes=53 * i) for i in range(5000)]  # ~6 months, dense
+    archive = _DatedArchive(times)
+    windows = initial_windows("StudyReceiveDateTime", start, datetime(2024, 12, 31), 365)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(archive.handler)) as client:
+            return [row async for page in crawl_pages(
+                client, "http://pacs/series", {}, "includefield=0020000E", name="split-test",
+                window_attr="StudyReceiveDateTime", windows=windows, page_size=100, concurrency=4,
+            ) for row in page]
+
+    rows  = asyncio.run(run())
+    stats = crawl_stats["split-test"]
+    assert len(rows) == 5000 and len({r["t"] for r in rows}) == 5000
+    assert archive.transferred == 5000
+    assert stats["rows"] == 5000 and stats["splits"] > 0
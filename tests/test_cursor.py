@@ -0,0 +1,66 @@
+import pytest
+from fastapi import HTTPException
+
+from app import _cursor_query, _decode_cursor, _encode_cursor, _next_cursor
+
+TAG = "00080020"
+
+
+def _state(**kw) -> dict:
+    state = {"r": "studies", "w": "DCM4CHEE", "n": 4, "p": 0, "q": "",
+             "a": "StudyDate", "g": TAG, "d": True, "k": None, "t": 0}
+    state.update(kw)
+    return state
+
+
+def _rows(*dates) -> list:
+    return [{TAG: {"vr": "DA", "Value": [d]}} for d in dates]
+
+
+def test_ties_on_the_last_key_become_the_offset():
+    nxt = _next_cursor(_state(), _rows("20240105", "20240104", "20240103", "20240103"))
+    assert (nxt["k"], nxt["t"], nxt["p"]) == ("20240103", 2, 4)
+
+
+def test_a_page_of_one_key_adds_to_the_previous_offset():
+    state = _state(k="20240103", t=2, p=4)
+    nxt = _next_cursor(state, _rows(*["20240103"] * 4))
+    assert (nxt["k"], nxt["t"]) == ("20240103", 6)
+
+
+def test_a_new_last_key_restarts_the_offset():
+    state = _state(k="20240103", t=6, p=8)
+    nxt = _next_cursor(state, _rows("20240103", "20240102", "20240102", "20240102"))
+    assert (nxt["k"], nxt["t"]) == ("20240102", 3)
+
+
+def test_keyset_query_resumes_after_the_ties():
+    query = _cursor_query(_state(k="20240103", t=2))
+    assert "StudyDate=-20240103" in query
+    assert query.endswith("offset=2")
+    ascending = _cursor_query(_state(k="20240103", t=2, d=False))
+    assert "StudyDate=20240103-" in ascending
+
+
+def test_short_page_ends_the_listing():
+    assert _next_cursor(_state(), _rows("20240105")) is None
+
+
+def test_missing_key_falls_back_to_offset_paging():
+    nxt = _next_cursor(_state(), [{}, {}, {}, {}])
+    assert "a" not in nxt and "k" not in nxt
+    assert nxt["p"] == 4
+    assert "orderby=-StudyDate" in nxt["q"]
+    assert _cursor_query(nxt).endswith("offset=4")
+
+
+def test_cursor_round_trip():
+    state = _state(k="20240103", t=2)
+    assert _decode_cursor(_encode_cursor(state), "studies") == state
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", _encode_cursor({"r": "series"}), _encode_cursor([1])])
+def test_foreign_or_garbled_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor, "studies")
+    assert exc.value.status_code == 400
@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app
+import app_state
+from qido_cache import ResponseCache
+
+STUDY = {
+    "00080020": {"vr": "DA", "Value": ["20240105"]},
+    "00080061": {"vr": "CS", "Value": ["CT"]},
+    "00100020": {"vr": "LO", "Value": ["P1"]},
+    "00201206": {"vr": "IS", "Value": [2]},
+    "00201208": {"vr": "IS", "Value": [40]},
+}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_state(monkeypatch):
+    monkeypatch.setattr(app, "_count_cache", ResponseCache(1024 * 1024))
+    monkeypatch.setattr(app, "_dashboard", {
+        "body": None, "etag": None, "generatedAt": None, "refreshing": None, "loop": None,
+    })
+    monkeypatch.setattr(app_state, "_device_cache", {
+        "configs": {}, "names": [], "listing_hash": None, "expires_at": 0.0, "refresh_task": None,
+        "version": 0, "ae_index": (-1, {}),
+    })
+
+
+def _archive(request):
+    path = request.url.path
+    if path.endswith("/count"):
+        return httpx.Response(200, json={"count": 7})
+    if path.endswith("/modalities"):
+        return httpx.Response(200, json=["CT", "MR"])
+    if path.endswith("/studies"):
+        return httpx.Response(200, json=[STUDY])
+    if path.endswith("/devices"):
+        return httpx.Response(200, json=[])
+    return httpx.Response(204)
+
+
+def test_dashboard_rebuild_uses_the_background_lane(dcm4chee):
+    seen = dcm4chee(_archive)
+    stats = asyncio.run(app._compute_network_dashboard())
+    assert stats["sampleSize"] == 1
+    assert stats["totalStudies"] == 7
+    assert {r.extensions["lane"] for r in seen} == {"background"}
+
+
+def test_counts_are_reused_by_the_next_rebuild(dcm4chee):
+    seen = dcm4chee(_archive)
+
+    async def run():
+        await app._compute_network_dashboard()
+        first = len(seen)
+        await app._compute_network_dashboard()
+        return first
+
+    first = asyncio.run(run())
+    counts = [r for r in seen if r.url.path.endswith("/count")]
+    assert len(counts) == len([r for r in seen[:first] if r.url.path.endswith("/count")]) > 0
+    assert app_state.COUNT_CACHE_TTL >= app_state.DASHBOARD_REFRESH_INTERVAL
+
+
+def test_lifespan_runs_and_stops_the_dashboard_loop(dcm4chee):
+    dcm4chee(_archive)
+
+    async def run():
+        async with app.app.router.lifespan_context(app.app):
+            loop = app._dashboard["loop"]
+            await app._refresh_dashboard()
+            assert not loop.done()
+        await asyncio.sleep(0)
+        assert loop.cancelled()
+
+    asyncio.run(run())
+    assert app._dashboard["body"] is not None
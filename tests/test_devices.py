@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app_state
+from conftest import api
+
+DEVICE = "dcm4chee-arc"
+CONFIG = {
+    "dicomDeviceName": DEVICE,
+    "dicomNetworkAE": [{"dicomAETitle": "DCM4CHEE", "dcmNetworkAE": {}}],
+    "dcmDevice": {"dcmArchiveDevice": {
+        "dcmStorage": [{"dcmStorageID": "fs1"}],
+        "dcmExporter": [{"dcmExporterID": "CLOUD", "dicomAETitle": "CLOUD"}],
+        "dcmExportRule": [{"cn": "to-cloud", "dcmExporterID": ["CLOUD"]}],
+    }},
+}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_device_cache(monkeypatch):
+    monkeypatch.setattr(app_state, "_device_cache", {
+        "configs": {}, "names": [], "listing_hash": None, "expires_at": 0.0, "refresh_task": None,
+        "version": 0, "ae_index": (-1, {}),
+    })
+
+
+def _archive(device_status):
+    """dcm4chee with one device; device_status() gives the status of each device GET."""
+    def handler(request):
+        if request.method == "PUT":
+            return httpx.Response(204)
+        if request.url.path.endswith("/devices"):
+            return httpx.Response(200, json=[{"dicomDeviceName": DEVICE}])
+        status = device_status()
+        return httpx.Response(status, json=CONFIG if status == 200 else None)
+    return handler
+
+
+def _statuses(*codes):
+    """Device GETs answer these statuses in order, the last one repeating."""
+    codes = list(codes)
+    return lambda: codes.pop(0) if len(codes) > 1 else codes[0]
+
+
+def _puts(seen):
+    return [r for r in seen if r.method == "PUT"]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/exporters", {"deviceName": DEVICE, "exporterID": "NEW", "aeTitle": "NEW"}),
+    ("/api/export-rules", {"deviceName": DEVICE, "cn": "new-rule"}),
+])
+@pytest.mark.parametrize("status", [503, 504])
+def test_create_never_puts_an_unread_config(dcm4chee, path, body, status):
+    seen = dcm4chee(_archive(_statuses(status)))
+    resp = api("POST", path, json=body)
+    assert resp.status_code == 502
+    assert _puts(seen) == []
+
+
+@pytest.mark.parametrize("path", ["/api/exporters/CLOUD", "/api/export-rules/to-cloud"])
+def test_delete_never_puts_an_unread_config(dcm4chee, path):
+    # The cache load reads the device; the edit's fresh read then fails.
+    seen = dcm4chee(_archive(_statuses(200, 503)))
+    resp = api("DELETE", path)
+    assert resp.status_code == 502
+    assert _puts(seen) == []
+
+
+def test_create_keeps_the_rest_of_the_device(dcm4chee):
+    seen = dcm4chee(_archive(_statuses(200)))
+    resp = api("POST", "/api/exporters", json={"deviceName": DEVICE, "exporterID": "NEW"})
+    assert resp.status_code == 200
+    (put,) = _puts(seen)
+    archive = json.loads(put.content)["dcmDevice"]["dcmArchiveDevice"]
+    assert archive["dcmStorage"] == [{"dcmStorageID": "fs1"}]
+    assert [e["dcmExporterID"] for e in archive["dcmExporter"]] == ["CLOUD", "NEW"]
+
+
+def _devices(devices, status=lambda: 200):
+    """dcm4chee serving the configs in `devices` (name -> config), read at request time."""
+    def handler(request):
+        if request.method == "PUT":
+            return httpx.Response(204)
+        if request.url.path.endswith("/devices"):
+            return httpx.Response(200, json=[{"dicomDeviceName": n} for n in devices])
+        code = status()
+        name = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(code, json=devices[name] if code == 200 else None)
+    return handler
+
+
+def _listings(seen):
+    return sum(1 for r in seen if r.method == "GET" and r.url.path.endswith("/devices"))
+
+
+def test_routing_rule_finds_an_ae_added_since_the_last_refresh(dcm4chee):
+    devices = {DEVICE: CONFIG}
+    seen = dcm4chee(_devices(devices))
+    assert api("GET", "/api/exporters").status_code == 200  # loads the cache
+    devices["modality-gw"] = {"dicomDeviceName": "modality-gw", "dicomNetworkAE": [{"dicomAETitle": "GW_SCP"}]}
+
+    resp = api("POST", "/api/routing-rules", json={"localAETitle": "GW_SCP", "destAETitle": "CLOUD"})
+    assert resp.status_code == 200
+    assert resp.json()["device"] == "modality-gw"
+    (put,) = _puts(seen)
+    assert put.url.path.endswith("/devices/modality-gw")
+
+
+def test_routing_rule_for_an_unknown_ae_refreshes_once(dcm4chee):
+    seen = dcm4chee(_devices({DEVICE: CONFIG}))
+    resp = api("POST", "/api/routing-rules", json={"localAETitle": "NOWHERE"})
+    assert resp.status_code == 404
+    assert _listings(seen) == 2  # initial load + one refresh on the miss
+    assert _puts(seen) == []
+
+
+def test_routing_rule_with_an_unreadable_owner_is_an_upstream_error(dcm4chee):
+    seen = dcm4chee(_devices({DEVICE: CONFIG}, _statuses(200, 503)))
+    resp = api("POST", "/api/routing-rules", json={"localAETitle": "DCM4CHEE", "deviceName": DEVICE})
+    assert resp.status_code == 502
+    assert _puts(seen) == []
+
+
+def _cached(devices: dict) -> None:
+    """Put configs straight into the device-config cache, fresh for the whole test."""
+    for name, config in devices.items():
+        app_state._device_cache["configs"][name] = {"config": config, "hash": "h", "etag": None, "last_modified": None}
+    app_state._device_cache["names"]      = list(devices)
+    app_state._device_cache["expires_at"] = float("inf")
+
+
+def _owner(title: str):
+    return asyncio.run(app_state.ae_owner(title))
+
+
+def test_ae_index_is_reused_until_a_config_changes():
+    _cached({DEVICE: CONFIG, "gw": {"dicomNetworkAE": [{"dicomAETitle": "GW_SCU"}, {"dicomAETitle": "GW_SCP"}]}})
+    assert _owner("GW_SCP") == ("gw", 1)
+    index = app_state._device_cache["ae_index"]
+    assert _owner("DCM4CHEE") == (DEVICE, 0)
+    assert app_state._device_cache["ae_index"] is index
+
+
+def test_own_write_invalidates_the_ae_index():
+    _cached({DEVICE: CONFIG, "gw": {"dicomNetworkAE": [{"dicomAETitle": "GW_SCP"}]}})
+    assert _owner("GW_SCP") == ("gw", 0)
+    app_state.store_device_config("gw", {"dicomNetworkAE": []})
+    app_state.store_device_config("new-gw", {"dicomNetworkAE": [{"dicomAETitle": "GW_SCP"}]})
+    assert _owner("GW_SCP") == ("new-gw", 0)
+
+
+def test_refresh_invalidates_the_ae_index(dcm4chee):
+    devices = {DEVICE: CONFIG}
+    dcm4chee(_devices(devices))
+
+    async def run():
+        before = await app_state.ae_owner("GW_SCP")
+        devices["gw"] = {"dicomNetworkAE": [{"dicomAETitle": "GW_SCP"}]}
+        await app_state.refresh_device_configs()
+        return before, await app_state.ae_owner("GW_SCP")
+
+    assert asyncio.run(run()) == (None, ("gw", 0))
+
+
+def test_first_device_wins_a_shared_ae_title():
+    _cached({DEVICE: CONFIG, "dup": {"dicomNetworkAE": [{"dicomAETitle": "DCM4CHEE"}]}})
+    assert _owner("DCM4CHEE") == (DEVICE, 0)
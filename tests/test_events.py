@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app
+from conftest import api
+
+
+@pytest.fixture(autouse=True)
+def _fresh_live(monkeypatch):
+    monkeypatch.setattr(app, "_live", {
+        "subscribers": set(), "poller": None, "wake": None, "dashboard": None,
+        "dashboardEtag": None, "exportTasks": {}, "seq": 0,
+    })
+    monkeypatch.setattr(app, "_live_stats", {"polls": 0, "events": 0, "dropped": 0})
+
+
+def _counts(request):
+    return httpx.Response(200, json={"count": len(request.url.params["status"])})
+
+
+def _subscribe() -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(app.LIVE_QUEUE_SIZE)
+    app._live["subscribers"].add(queue)
+    return queue
+
+
+def test_poller_reads_export_counts_on_the_background_lane(dcm4chee):
+    seen  = dcm4chee(_counts)
+    queue = _subscribe()
+    asyncio.run(app._poll_live())
+    assert {r.extensions["lane"] for r in seen} == {"background"}
+    event = queue.get_nowait()
+    assert event.startswith(b"event: exportTasks\n")
+    assert app._live["exportTasks"]["FAILED"] == len("FAILED")
+
+
+def test_poller_pushes_only_changed_counters(dcm4chee):
+    dcm4chee(_counts)
+    queue = _subscribe()
+    app._live["exportTasks"] = {s: len(s) for s in app.EXPORT_STATUSES if s != "WARNING"}
+    asyncio.run(app._poll_live())
+    event = queue.get_nowait()
+    assert b'"WARNING":7' in event and b"FAILED" not in event
+    asyncio.run(app._poll_live())
+    assert queue.empty()
+
+
+def test_export_task_endpoint_stays_on_the_interactive_lane(dcm4chee):
+    seen = dcm4chee(_counts)
+    resp = api("GET", "/api/export-tasks")
+    assert resp.json()["COMPLETED"] == len("COMPLETED")
+    assert {r.extensions["lane"] for r in seen} == {"interactive"}
@@ -0,0 +1,61 @@
+from array import array
+
+import pytest
+
+from app_state import IdSet, _uid_hash
+
+
+def _members(ids: IdSet) -> set:
+    return set(array("q", ids.to_bytes())) - {0}
+
+
+def test_duplicates_are_counted_once():
+    ids = IdSet()
+    for h in (7, 7, 9, 7):
+        ids.add(h)
+    assert len(ids) == 2
+    assert _members(ids) == {7, 9}
+
+
+def test_colliding_ids_probe_to_the_next_slot():
+    ids = IdSet()
+    colliding = [16 * k + 3 for k in range(1, 6)]  # all hash to slot 3 of 16
+    for h in colliding + colliding:
+        ids.add(h)
+    assert len(ids) == 5
+    assert _members(ids) == set(colliding)
+
+
+def test_negative_ids_wrap_to_a_slot():
+    ids = IdSet()
+    ids.add(-5)
+    ids.add(-5)
+    assert _members(ids) == {-5}
+
+
+def test_grows_past_three_quarters_and_keeps_members():
+    ids = IdSet()
+    hashes = [_uid_hash(f"1.2.840.{i}") for i in range(1000)]
+    for h in hashes:
+        ids.add(h)
+    size = len(ids.to_bytes()) // 8
+    assert len(ids) == 1000
+    assert size & (size - 1) == 0 and len(ids) * 4 <= size * 3
+    assert _members(ids) == set(hashes)
+
+
+def test_bytes_round_trip():
+    ids = IdSet()
+    for i in range(100):
+        ids.add(_uid_hash(str(i)))
+    loaded = IdSet.from_bytes(ids.to_bytes())
+    assert len(loaded) == 100
+    assert _members(loaded) == _members(ids)
+    loaded.add(_uid_hash("0"))
+    assert len(loaded) == 100
+
+
+@pytest.mark.parametrize("data", [b"", bytes(8 * 8), bytes(8 * 24)])
+def test_from_bytes_rejects_malformed_tables(data):
+    with pytest.raises(ValueError):
+        IdSet.from_bytes(data)
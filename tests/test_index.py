@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import app_state
+from app_state import InstitutionIndex
+
+
+@pytest.fixture(autouse=True)
+def _index_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_state, "INDEX_DB_PATH", str(tmp_path / "index.db"))
+
+
+def _series(uid: str, institution: str, modality: str) -> dict:
+    return {
+        "0020000D": {"vr": "UI", "Value": [uid]},
+        "00080080": {"vr": "LO", "Value": [institution]},
+        "00080060": {"vr": "CS", "Value": [modality]},
+        "00100020": {"vr": "LO", "Value": ["P1"]},
+        "00080020": {"vr": "DA", "Value": ["20200101"]},
+    }
+
+
+def test_delta_picks_up_a_series_added_to_an_old_study(dcm4chee):
+    # The study was received long before the watermark; only its update time is recent.
+    added = _series("1.2.3", "Alpha Hosp", "MR")
+
+    def handler(request):
+        lo = request.url.params.get("StudyUpdateDateTime", "").split("-")[0]
+        updated = lo and lo <= "20240601120000"
+        if request.url.path.endswith("/count"):
+            return httpx.Response(200, json={"count": 1 if updated else 0})
+        if updated and request.url.path.endswith("/series"):
+            return httpx.Response(200, json=[added])
+        return httpx.Response(204)
+
+    seen  = dcm4chee(handler)
+    index = InstitutionIndex()
+    index.watermark = "20240601000000"
+    asyncio.run(app_state._apply_index_delta(index))
+
+    assert index.buckets["Alpha Hosp"]["modalities"] == {"MR"}
+    ranges = {r.url.params.get("StudyUpdateDateTime") for r in seen}
+    assert any(r and r.startswith("20240601000000-") for r in ranges)
+    assert not any("StudyReceiveDateTime" in r.url.params for r in seen)
+
+
+@pytest.fixture
+def hospitals(monkeypatch):
+    """Fresh hospital snapshot state; returns the _index_state dict."""
+    state = {"index": None, "resync_task": None}
+    monkeypatch.setattr(app_state, "_index_state", state)
+    monkeypatch.setattr(app_state, "_hospitals_cache", {"data": None, "expires_at": 0.0, "refresh_task": None})
+    return state
+
+
+def _bucket_index(name: str) -> InstitutionIndex:
+    index = InstitutionIndex()
+    index.watermark      = "20240601000000"
+    index.full_synced_at = time.monotonic()
+    index.add_series([_series("1.2.3", name, "CT")])
+    return index
+
+
+def test_failed_first_build_backs_off(hospitals, monkeypatch):
+    builds = []
+
+    async def failing_build():
+        builds.append(1)
+        raise RuntimeError("archive down")
+
+    monkeypatch.setattr(app_state, "_full_build_index", failing_build)
+
+    async def run():
+        first  = await app_state.fetch_hospitals_cached()
+        second = await app_state.fetch_hospitals_cached()
+        return first, second
+
+    assert asyncio.run(run()) == ([], [])
+    assert len(builds) == 1
+
+
+def test_delta_finishing_after_a_resync_does_not_publish_the_old_index(hospitals, monkeypatch):
+    old, new = _bucket_index("Old Hosp"), _bucket_index("New Hosp")
+    hospitals["index"] = old
+    app_state._hospitals_cache["data"] = new.institutions()  # as published by the resync
+
+    async def delta_overtaken_by_resync(index):
+        hospitals["index"] = new
+
+    monkeypatch.setattr(app_state, "_apply_index_delta", delta_overtaken_by_resync)
+    asyncio.run(app_state._refresh_hospitals())
+    assert [h["name"] for h in app_state._hospitals_cache["data"]] == ["New Hosp"]
+
+    asyncio.run(app_state._persist_index(old))
+    assert app_state._load_index_snapshot() is None
+    asyncio.run(app_state._persist_index(new))
+    assert set(app_state._load_index_snapshot().buckets) == {"New Hosp"}
+
+
+def test_concurrent_first_callers_share_one_build(hospitals, monkeypatch):
+    builds = []
+
+    async def slow_build():
+        builds.append(1)
+        await asyncio.sleep(0.01)
+        return _bucket_index("Alpha Hosp")
+
+    monkeypatch.setattr(app_state, "_full_build_index", slow_build)
+
+    async def run():
+        return await asyncio.gather(*(app_state.fetch_hospitals_cached() for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(builds) == 1
+    assert all([h["name"] for h in r] == ["Alpha Hosp"] for r in results)
+
+
+def test_expired_snapshot_is_served_while_one_delta_runs(hospitals, monkeypatch):
+    hospitals["index"] = _bucket_index("Alpha Hosp")
+    app_state._hospitals_cache["data"] = [{"name": "Stale Hosp"}]
+    deltas, release = [], None
+
+    async def blocked_delta(index):
+        deltas.append(1)
+        await release.wait()
+        index.add_series([_series("1.2.4", "Beta Hosp", "MR")])
+
+    monkeypatch.setattr(app_state, "_apply_index_delta", blocked_delta)
+    monkeypatch.setattr(app_state, "_schedule_full_resync", lambda: None)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        served  = [await app_state.fetch_hospitals_cached() for _ in range(3)]
+        await asyncio.sleep(0)
+        assert deltas == [1]
+        release.set()
+        await app_state._hospitals_cache["refresh_task"]
+        return served, await app_state.fetch_hospitals_cached()
+
+    served, fresh = asyncio.run(run())
+    assert all(s == [{"name": "Stale Hosp"}] for s in served)
+    assert {h["name"] for h in fresh} == {"Alpha Hosp", "Beta Hosp"}
@@ -0,0 +1,82 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+import app_state
+from app_state import IdSet, InstitutionIndex
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "index.db")
+    monkeypatch.setattr(app_state, "INDEX_DB_PATH", path)
+    return path
+
+
+def _save(index: InstitutionIndex) -> None:
+    app_state._save_index_snapshot(*app_state._index_snapshot_rows(index))
+
+
+def _index() -> InstitutionIndex:
+    index = InstitutionIndex()
+    index.watermark = "20240101000000"
+    index.full_synced_at = 1.0
+    index.buckets["Alpha Hosp"] = {
+        "address": "addr", "study_uids": IdSet(), "patient_ids": IdSet(),
+        "modalities": {"CT"}, "departments": {"Radiology"}, "last_date": "20240101",
+    }
+    index.buckets["Alpha Hosp"]["study_uids"].add(app_state._uid_hash("1.2.3"))
+    return index
+
+
+def test_snapshot_round_trip(snapshot_path):
+    _save(_index())
+    loaded = app_state._load_index_snapshot()
+    assert loaded.watermark == "20240101000000"
+    bucket = loaded.buckets["Alpha Hosp"]
+    assert bucket["modalities"] == {"CT"}
+    assert len(bucket["study_uids"]) == 1
+
+
+@pytest.mark.parametrize("column, value", [
+    ("modalities", '["CT", '),               # truncated JSON
+    ("departments", "null"),                 # TypeError from set(None)
+    ("study_uids", b"\x01\x02\x03"),         # not a whole number of slots
+    ("study_uids", b"\x01" * 8 * 24),        # slot count not a power of two
+])
+def test_corrupt_snapshot_is_ignored(snapshot_path, column, value):
+    _save(_index())
+    conn = sqlite3.connect(snapshot_path)
+    conn.execute(f"UPDATE institution_index_buckets SET {column} = ?", (value,))
+    conn.commit()
+    conn.close()
+    assert app_state._load_index_snapshot() is None
+
+
+def test_missing_snapshot(snapshot_path):
+    assert app_state._load_index_snapshot() is None
+
+
+@pytest.mark.parametrize("studies_indexed, resync", [(False, True), (True, False)])
+def test_snapshot_without_study_table_schedules_backfill(snapshot_path, monkeypatch, studies_indexed, resync):
+    index = _index()
+    index.full_synced_at = time.monotonic()
+    _save(index)
+    app_state._prune_rollup(0.0)  # rollup already backfilled
+    if studies_indexed:
+        app_state._write_study_institutions([("1.2.3", "Alpha Hosp", "20240101", time.time())])
+
+    scheduled = []
+    monkeypatch.setitem(app_state._index_state, "index", None)
+    monkeypatch.setattr(app_state, "_hospitals_cache", {"data": None, "expires_at": 0.0, "refresh_task": None})
+    monkeypatch.setattr(app_state, "_apply_index_delta", _no_delta)
+    monkeypatch.setattr(app_state, "_schedule_full_resync", lambda: scheduled.append(True))
+    app_state._warm_start()
+    asyncio.run(app_state._refresh_hospitals())
+    assert bool(scheduled) is resync
+
+
+async def _no_delta(index) -> None:
+    return None
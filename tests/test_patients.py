@@ -0,0 +1,20 @@
+import httpx
+
+from conftest import api
+
+
+def test_limited_search_with_no_matches_returns_empty_compact_body(dcm4chee):
+    dcm4chee(lambda request: httpx.Response(204))
+    resp = api("GET", "/api/patients?limit=5&format=compact&layout=columns")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["count"] == 0
+    assert all(values == [] for values in body["columns"].values())
+
+
+def test_limited_search_with_no_matches_returns_empty_list(dcm4chee):
+    seen = dcm4chee(lambda request: httpx.Response(204))
+    resp = api("GET", "/api/patients?limit=5")
+    assert resp.status_code == 200
+    assert resp.json() == []
+    assert seen[0].url.params["limit"] == "5"
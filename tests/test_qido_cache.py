@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+import qido_cache
+from qido_cache import Coalescer, ResponseCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(qido_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_hit_then_expiry_then_stale(clock):
+    cache = ResponseCache(1000)
+    cache.put("k", (b"[]", "application/dicom+json"), 2, ttl=10)
+    assert cache.get("k") == (True, (b"[]", "application/dicom+json"))
+    clock[0] += 10
+    assert cache.get("k") == (False, None)
+    assert cache.get_stale("k") == (True, (b"[]", "application/dicom+json"))
+    assert cache.stats["expired"] == 1 and cache.stats["staleServed"] == 1
+
+
+def test_byte_budget_evicts_least_recently_used(clock):
+    cache = ResponseCache(10)
+    cache.put("a", 1, 4, ttl=60)
+    cache.put("b", 2, 4, ttl=60)
+    cache.get("a")                 # b is now the oldest
+    cache.put("c", 3, 4, ttl=60)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1) and cache.get("c") == (True, 3)
+    assert cache.bytes == 8 and cache.stats["evictions"] == 1
+
+
+def test_replacing_an_entry_keeps_the_byte_count(clock):
+    cache = ResponseCache(10)
+    cache.put("a", 1, 4, ttl=60)
+    cache.put("a", 2, 6, ttl=60)
+    assert cache.bytes == 6 and cache.get("a") == (True, 2)
+
+
+@pytest.mark.parametrize("size, ttl", [(11, 60), (1, 0)])
+def test_oversized_or_uncacheable_entries_are_not_stored(clock, size, ttl):
+    cache = ResponseCache(10)
+    cache.put("a", 1, size, ttl)
+    assert cache.get("a") == (False, None) and cache.bytes == 0
+
+
+def test_invalidate_by_key_predicate(clock):
+    cache = ResponseCache(100)
+    for key in [("DCM4CHEE", "studies", ""), ("DCM4CHEE", "series", ""), ("OTHER", "studies", "")]:
+        cache.put(key, 1, 1, ttl=60)
+    assert cache.invalidate(lambda k: k[1] == "studies") == 2
+    assert cache.get(("DCM4CHEE", "series", "")) == (True, 1)
+    assert cache.invalidate() == 1 and cache.bytes == 0
+
+
+def test_normalize_query_ignores_parameter_order():
+    assert normalize_query("b=2&a=1&") == normalize_query("a=1&b=2")
+
+
+def test_coalescer_shares_one_call_between_concurrent_waiters():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "rows"
+
+    async def run():
+        c = Coalescer()
+        results = await asyncio.gather(*[c.run("k", fetch) for _ in range(5)])
+        return c, results
+
+    c, results = asyncio.run(run())
+    assert results == ["rows"] * 5 and len(calls) == 1
+    assert c.stats == {"leaders": 1, "coalesced": 4}
+    assert c.as_dict()["inflight"] == 0
+
+
+def test_coalescer_hands_the_error_to_every_waiter_and_forgets_it():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        c = Coalescer()
+        results = await asyncio.gather(*[c.run("k", failing) for _ in range(3)], return_exceptions=True)
+        again = await c.run("k", _ok)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert again == "ok"  # a later call starts afresh
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "rows"
+
+    async def run():
+        c = Coalescer()
+        first  = asyncio.ensure_future(c.run("k", slow))
+        second = asyncio.ensure_future(c.run("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "rows"
+
+
+async def _ok():
+    return "ok"
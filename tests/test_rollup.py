@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+import app_state
+
+
+@pytest.fixture(autouse=True)
+def _index_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_state, "INDEX_DB_PATH", str(tmp_path / "index.db"))
+
+
+def _series(uid: str, institution: str, modality: str, day: str = "20240105") -> dict:
+    return {
+        "0020000D": {"vr": "UI", "Value": [uid]},
+        "00080080": {"vr": "LO", "Value": [institution]},
+        "00080060": {"vr": "CS", "Value": [modality]},
+        "00080020": {"vr": "DA", "Value": [day]},
+    }
+
+
+def _record(*rows) -> None:
+    asyncio.run(app_state._record_rollup(list(rows)))
+
+
+def _trend(period: str = "day", institution=None) -> dict:
+    out = asyncio.run(app_state.study_trend(period, "2024-01-01", "2024-12-31", institution))
+    return {p["period"]: (p["studies"], p["byModality"]) for p in out["periods"]}
+
+
+def test_a_study_counts_once_with_each_of_its_modalities():
+    _record(_series("1", "Alpha", "CT"), _series("1", "Alpha", "SR"), _series("2", "Alpha", "CT"))
+    assert _trend() == {"2024-01-05": (2, {"CT": 2, "SR": 1})}
+
+
+def test_reapplied_rows_do_not_inflate_counts():
+    for _ in range(3):
+        _record(_series("1", "Alpha", "CT"))
+    assert _trend() == {"2024-01-05": (1, {"CT": 1})}
+
+
+def test_a_moved_study_is_uncounted_where_it_was():
+    _record(_series("1", "Alpha", "CT"))
+    _record(_series("1", "Beta", "CT", day="20240210"))
+    assert _trend(institution="alpha") == {}
+    assert _trend(institution="Beta") == {"2024-02-10": (1, {"CT": 1})}
+
+
+def test_week_and_month_buckets():
+    _record(_series("1", "Alpha", "CT", "20240101"), _series("2", "Alpha", "MR", "20240107"),
+            _series("3", "Alpha", "MR", "20240108"))
+    assert _trend("week") == {"2024-01-01": (2, {"CT": 1, "MR": 1}), "2024-01-08": (1, {"MR": 1})}
+    assert _trend("month") == {"2024-01": (3, {"CT": 1, "MR": 2})}
+
+
+def test_full_crawl_prune_uncounts_unseen_studies_and_marks_backfilled():
+    _record(_series("old", "Alpha", "CT"))
+    started = time.time() + 1  # the full crawl starts after "old" was last seen ...
+    app_state._write_rollup_facts(  # ... and sees only "kept"
+        {("kept", ""): ("2024-01-05", "Alpha"), ("kept", "CT"): ("2024-01-05", "Alpha")}, started + 1,
+    )
+    assert not app_state._rollup_backfilled()
+    app_state._prune_rollup(started)
+    assert app_state._rollup_backfilled()
+    assert _trend() == {"2024-01-05": (1, {"CT": 1})}
+
+
+def test_rows_without_institution_or_date_are_skipped():
+    _record({**_series("1", "", "CT")}, {**_series("2", "Alpha", "CT", day="2024")})
+    assert _trend() == {}
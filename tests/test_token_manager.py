@@ -0,0 +1,131 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from token_manager import BearerAuth, TokenManager
+
+TOKEN_URL = "http://keycloak:8843/realms/dcm4che/protocol/openid-connect/token"
+
+
+class _Keycloak:
+    def __init__(self, refresh_ok: bool = True, password_ok: bool = True) -> None:
+        self.grants      = []
+        self.refresh_ok  = refresh_ok
+        self.password_ok = password_ok
+
+    def handler(self, request):
+        grant = parse_qs(request.content.decode())["grant_type"][0]
+        self.grants.append(grant)
+        ok = self.refresh_ok if grant == "refresh_token" else self.password_ok
+        if not ok:
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        return httpx.Response(200, json={
+            "access_token": f"t{len(self.grants)}", "expires_in": 300,
+            "refresh_token": "r", "refresh_expires_in": 1800,
+        })
+
+    def manager(self) -> TokenManager:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        return TokenManager(client, TOKEN_URL, "dcm4chee-arc-ui", "root", "changeit")
+
+
+def test_concurrent_callers_share_one_grant():
+    keycloak = _Keycloak()
+
+    async def run():
+        tm = keycloak.manager()
+        return await asyncio.gather(*[tm.get() for _ in range(10)])
+
+    assert asyncio.run(run()) == ["t1"] * 10
+    assert keycloak.grants == ["password"]
+
+
+def test_expired_token_is_renewed_with_the_refresh_token():
+    keycloak = _Keycloak()
+
+    async def run():
+        tm = keycloak.manager()
+        await tm.get()
+        tm.invalidate("t1")
+        return await tm.get(), tm.stats
+
+    token, stats = asyncio.run(run())
+    assert token == "t2"
+    assert keycloak.grants == ["password", "refresh_token"]
+    assert stats["refreshGrants"] == 1
+
+
+def test_rejected_refresh_token_falls_back_to_the_password_grant():
+    keycloak = _Keycloak(refresh_ok=False)
+
+    async def run():
+        tm = keycloak.manager()
+        await tm.get()
+        tm.invalidate("t1")
+        return await tm.get()
+
+    assert asyncio.run(run()) == "t3"
+    assert keycloak.grants == ["password", "refresh_token", "password"]
+
+
+def test_failed_login_is_a_401():
+    keycloak = _Keycloak(password_ok=False)
+
+    async def run():
+        tm = keycloak.manager()
+        with pytest.raises(HTTPException) as exc:
+            await tm.get()
+        return exc.value.status_code, tm.stats["failures"]
+
+    assert asyncio.run(run()) == (401, 1)
+
+
+def test_invalidate_ignores_a_token_that_was_already_replaced():
+    keycloak = _Keycloak()
+
+    async def run():
+        tm = keycloak.manager()
+        await tm.get()
+        tm.invalidate("some-older-token")
+        return await tm.get()
+
+    assert asyncio.run(run()) == "t1"
+    assert keycloak.grants == ["password"]
+
+
+def test_bearer_auth_retries_once_with_a_fresh_token_after_a_401():
+    keycloak = _Keycloak()
+    seen = []
+
+    def archive(request):
+        seen.append(request.headers["Authorization"])
+        return httpx.Response(401 if request.headers["Authorization"] == "Bearer t1" else 200)
+
+    async def run():
+        tm = keycloak.manager()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(archive), auth=BearerAuth(tm)) as c:
+            resp = await c.get("http://pacs:8080/dcm4chee-arc/aets/DCM4CHEE/rs/studies")
+        return resp.status_code, tm.stats["retried401"]
+
+    assert asyncio.run(run()) == (200, 1)
+    assert seen == ["Bearer t1", "Bearer t2"]
+
+
+def test_persistent_401_is_returned_after_one_retry():
+    keycloak = _Keycloak()
+    calls = []
+
+    def archive(request):
+        calls.append(1)
+        return httpx.Response(401)
+
+    async def run():
+        tm = keycloak.manager()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(archive), auth=BearerAuth(tm)) as c:
+            return (await c.get("http://pacs:8080/studies")).status_code
+
+    assert asyncio.run(run()) == 401
+    assert len(calls) == 2
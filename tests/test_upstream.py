@@ -0,0 +1,143 @@
+import asyncio
+
+import httpx
+import pytest
+
+import upstream
+from upstream import ResilientTransport, set_deadline
+
+
+@pytest.fixture(autouse=True)
+def _fresh_breakers():
+    upstream.breakers.clear()
+    set_deadline(None)
+    yield
+    upstream.breakers.clear()
+    set_deadline(None)
+
+
+def _client(handler) -> httpx.AsyncClient:
+    transport = ResilientTransport(httpx.MockTransport(handler), retries=0, backoff=0.0,
+                                   breaker_threshold=2, breaker_cooldown=60.0)
+    return httpx.AsyncClient(transport=transport)
+
+
+def test_breaker_is_keyed_by_host_and_port():
+    def handler(request):
+        return httpx.Response(503 if request.url.port == 8843 else 200)
+
+    async def run():
+        async with _client(handler) as c:
+            for _ in range(3):
+                await c.get("http://172.16.16.221:8843/realms/token")
+            keycloak = await c.get("http://172.16.16.221:8843/realms/token")
+            archive  = await c.get("http://172.16.16.221:8080/dcm4chee-arc/aets/DCM4CHEE/rs/studies")
+        return keycloak, archive
+
+    keycloak, archive = asyncio.run(run())
+    assert "circuit open" in keycloak.text
+    assert archive.status_code == 200
+    state = upstream.upstream_state()["breakers"]
+    assert state["172.16.16.221:8843"]["state"] == "open"
+    assert state["172.16.16.221:8080"]["state"] == "closed"
+
+
+def _failing(exc_type):
+    def handler(request):
+        raise exc_type("boom", request=request)
+    return handler
+
+
+def _breaker_after(handler, requests: int, deadline=None):
+    async def run():
+        async with _client(handler) as c:
+            for _ in range(requests):
+                set_deadline(deadline)
+                with pytest.raises(httpx.TransportError):
+                    await c.get("http://pacs:8080/studies")
+
+    asyncio.run(run())
+    return upstream.breakers["pacs:8080"]
+
+
+def test_pool_timeout_does_not_open_breaker():
+    breaker = _breaker_after(_failing(httpx.PoolTimeout), 5)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_timeout_shortened_by_deadline_does_not_open_breaker():
+    # 0.5s left is less than the 5s default timeout, so the deadline set the limit.
+    breaker = _breaker_after(_failing(httpx.ReadTimeout), 5, deadline=0.5)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_real_read_timeout_opens_breaker():
+    breaker = _breaker_after(_failing(httpx.ReadTimeout), 2)
+    assert breaker.state == "open"
+
+
+def test_connect_error_opens_breaker_even_under_deadline():
+    breaker = _breaker_after(_failing(httpx.ConnectError), 2, deadline=0.5)
+    assert breaker.state == "open"
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(upstream.time, "monotonic", c)
+    return c
+
+
+def test_breaker_opens_after_threshold_consecutive_failures(clock):
+    breaker = upstream.CircuitBreaker(threshold=3, cooldown=10.0)
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)  # a success resets the count
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow() and breaker.rejected == 1
+    assert breaker.as_dict()["retryInSec"] == 10.0
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = upstream.CircuitBreaker(threshold=1, cooldown=10.0)
+    breaker.record(False)
+    clock.now += 9.9
+    assert not breaker.allow()
+    clock.now += 0.1
+    assert breaker.allow() and breaker.state == "half-open"
+    assert not breaker.allow()  # the probe is still in flight
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = upstream.CircuitBreaker(threshold=2, cooldown=10.0)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 10.0
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_a_full_cooldown(clock):
+    breaker = upstream.CircuitBreaker(threshold=2, cooldown=10.0)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 10.0
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.opened_at == clock.now
+    clock.now += 5.0
+    assert not breaker.allow()
@@ -0,0 +1,154 @@
+"""
+Keycloak bearer-token manager for the dcm4chee service account.
+
+- one refresh in flight at a time; concurrent callers share its result
+- refreshes in the background before the token expires, so requests never
+  wait for Keycloak while the token is being renewed
+- uses the refresh_token grant while the refresh token is valid and falls back
+  to the password grant otherwise
+- BearerAuth plugs into httpx: it sets the header and, on a 401 from
+  dcm4chee, invalidates the token and retries the request once
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from upstream import set_deadline
+
+
+class TokenManager:
+    # Renew once this fraction of the usable token lifetime has passed.
+    REFRESH_AT   = 0.75
+    # Treat the token as expired this many seconds before Keycloak does.
+    EXPIRY_SLACK = 10.0
+    RETRY_DELAY  = 5.0
+
+    def __init__(
+        self, client: httpx.AsyncClient, token_url: str, client_id: str,
+        username: str, password: str,
+    ) -> None:
+        self._client    = client
+        self._token_url = token_url
+        self._client_id = client_id
+        self._username  = username
+        self._password  = password
+
+        self._access: str            = ""
+        self._expires_at: float      = 0.0
+        self._refresh_token: str     = ""
+        self._refresh_expires: float = 0.0
+        self._refresh_due: float     = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.Task]      = None
+
+        self.stats: Dict = {
+            "passwordGrants": 0, "refreshGrants": 0, "failures": 0,
+            "proactiveRefreshes": 0, "retried401": 0,
+            "lastLatencyMs": None, "avgLatencyMs": None,
+        }
+        self._latency_total = 0.0
+
+    async def get(self) -> str:
+        """Current access token, refreshing (once, for all callers) if it has expired."""
+        if self._access and time.monotonic() < self._expires_at:
+            return self._access
+        return await self._refresh()
+
+    def invalidate(self, stale: str) -> None:
+        """Drop `stale` if it is still the current token (e.g. after a 401)."""
+        if stale and self._access == stale:
+            self._access     = ""
+            self._expires_at = 0.0
+
+    def _refresh(self) -> "asyncio.Future":
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # shield: a cancelled caller must not cancel the refresh the others are awaiting
+        return asyncio.shield(self._inflight)
+
+    async def _grant(self, data: dict) -> Optional[dict]:
+        resp = await self._client.post(self._token_url, data=data, auth=None)
+        return resp.json() if resp.status_code == 200 else None
+
+    async def _fetch(self) -> str:
+        t0  = time.monotonic()
+        payload = None
+        if self._refresh_token and t0 < self._refresh_expires:
+            payload = await self._grant({
+                "grant_type":    "refresh_token",
+                "client_id":     self._client_id,
+                "refresh_token": self._refresh_token,
+            })
+            if payload:
+                self.stats["refreshGrants"] += 1
+        if payload is None:
+            payload = await self._grant({
+                "grant_type": "password",
+                "client_id":  self._client_id,
+                "username":   self._username,
+                "password":   self._password,
+            })
+            if payload is None:
+                self.stats["failures"] += 1
+                raise HTTPException(status_code=401, detail="Authentication failed")
+            self.stats["passwordGrants"] += 1
+
+        now      = time.monotonic()
+        lifetime = payload.get("expires_in", 300)
+        self._access          = payload["access_token"]
+        self._expires_at      = now + max(lifetime - self.EXPIRY_SLACK, lifetime * 0.5)
+        self._refresh_due     = now + (self._expires_at - now) * self.REFRESH_AT
+        self._refresh_token   = payload.get("refresh_token", "")
+        self._refresh_expires = now + payload.get("refresh_expires_in", 0) * self.REFRESH_AT
+
+        latency = (now - t0) * 1000
+        self._latency_total += latency
+        grants = self.stats["passwordGrants"] + self.stats["refreshGrants"]
+        self.stats["lastLatencyMs"] = round(latency, 1)
+        self.stats["avgLatencyMs"]  = round(self._latency_total / grants, 1)
+
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._proactive_loop())
+        return self._access
+
+    async def _proactive_loop(self) -> None:
+        """Renew the token at REFRESH_AT of its lifetime, ahead of any request."""
+        set_deadline(None)  # started from a request; must outlive its deadline budget
+        while True:
+            await asyncio.sleep(max(self._refresh_due - time.monotonic(), 0.0))
+            if time.monotonic() < self._refresh_due:
+                continue  # a request-driven refresh moved the deadline
+            try:
+                await self._refresh()
+                self.stats["proactiveRefreshes"] += 1
+            except Exception as e:
+                print(f"[token] Background refresh failed: {e}")
+                self._refresh_due = time.monotonic() + self.RETRY_DELAY
+
+    def as_dict(self) -> dict:
+        return {
+            **self.stats,
+            "expiresInSec": max(round(self._expires_at - time.monotonic(), 1), 0.0),
+            "hasRefreshToken": bool(self._refresh_token),
+        }
+
+
+class BearerAuth(httpx.Auth):
+    """httpx auth flow: current bearer token, one retry with a fresh token on 401."""
+
+    def __init__(self, manager: TokenManager) -> None:
+        self.manager = manager
+
+    async def async_auth_flow(self, request: httpx.Request):
+        token = await self.manager.get()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+        if response.status_code == 401:
+            self.manager.stats["retried401"] += 1
+            self.manager.invalidate(token)
+            token = await self.manager.get()
+            request.headers["Authorization"] = f"Bearer {token}"
+            yield request
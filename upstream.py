@@ -0,0 +1,168 @@
+"""
+Resilient upstream transport shared by every httpx client in app_state.
+
+Wraps the real transport, so each client.get/put in the handlers gets:
+- bounded retries with exponential backoff and full jitter, for idempotent
+  requests only (GET/HEAD), on transport errors and 502/503/504
+- a deadline budget per incoming API request (set by a middleware through
+  a contextvar); every attempt's timeouts are capped by the time left
+- a circuit breaker per upstream host:port (Keycloak and dcm4chee may share a
+  host); while it is open requests fail fast with a synthetic 503 instead of
+  waiting for timeouts
+
+Synthetic 503/504 responses flow through the handlers' usual status mapping,
+and the cached paths (e.g. the hospital snapshot) keep serving their last data.
+"""
+import asyncio
+import contextvars
+import random
+import time
+from typing import Dict, Optional
+
+import httpx
+
+RETRY_STATUSES   = {502, 503, 504}
+IDEMPOTENT       = {"GET", "HEAD"}
+
+# Absolute monotonic deadline of the API request being served, if any.
+_deadline: contextvars.ContextVar = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+def set_deadline(seconds: Optional[float]) -> None:
+    """Give the current request (and tasks it spawns) `seconds` of upstream time; None clears it."""
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def time_left() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """closed → open after `threshold` consecutive failures → half-open after `cooldown` → closed."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown  = cooldown
+        self.state     = "closed"
+        self.failures  = 0
+        self.opened_at = 0.0
+        self.probing   = False
+        self.rejected  = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half-open"
+        if self.state == "closed":
+            return True
+        if self.state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, ok: bool) -> None:
+        self.probing = False
+        if ok:
+            self.state, self.failures = "closed", 0
+            return
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.threshold:
+            if self.state != "open":
+                print(f"[upstream] circuit open after {self.failures} failures")
+            self.state, self.opened_at = "open", time.monotonic()
+
+    def as_dict(self) -> dict:
+        d = {"state": self.state, "consecutiveFailures": self.failures, "rejected": self.rejected}
+        if self.state == "open":
+            d["retryInSec"] = round(max(self.cooldown - (time.monotonic() - self.opened_at), 0.0), 1)
+        return d
+
+
+# One breaker per upstream host:port, shared by all clients (lanes).
+breakers: Dict[str, CircuitBreaker] = {}
+retry_stats: Dict[str, int] = {"retries": 0, "deadlineExceeded": 0, "failFast": 0, "localTimeouts": 0}
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self, inner: httpx.AsyncBaseTransport, *, retries: int = 2, backoff: float = 0.2,
+        breaker_threshold: int = 5, breaker_cooldown: float = 30.0,
+    ) -> None:
+        self.inner             = inner
+        self.retries           = retries
+        self.backoff           = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown  = breaker_cooldown
+
+    def _breaker(self, netloc: str) -> CircuitBreaker:
+        b = breakers.get(netloc)
+        if b is None:
+            b = breakers[netloc] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return b
+
+    def _cap_timeouts(self, request: httpx.Request, left: Optional[float]) -> bool:
+        """Cap the attempt's timeouts by the time left; True if the deadline shortened any."""
+        if left is None:
+            return False
+        capped  = False
+        timeout = dict(request.extensions.get("timeout") or {})
+        for key in ("connect", "read", "write", "pool"):
+            current = timeout.get(key)
+            if current is None or left < current:
+                timeout[key], capped = left, True
+        request.extensions["timeout"] = timeout
+        return capped
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        breaker   = self._breaker(request.url.netloc.decode("ascii"))
+        retryable = request.method in IDEMPOTENT
+        attempt   = 0
+        while True:
+            left = time_left()
+            if left is not None and left <= 0:
+                retry_stats["deadlineExceeded"] += 1
+                return httpx.Response(504, text="Upstream deadline exceeded", request=request)
+            if not breaker.allow():
+                retry_stats["failFast"] += 1
+                return httpx.Response(503, text="dcm4chee unavailable (circuit open)", request=request)
+            capped = self._cap_timeouts(request, left)
+            try:
+                response = await self.inner.handle_async_request(request)
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.PoolTimeout) or (capped and isinstance(e, httpx.TimeoutException)):
+                    # Our own limits (local pool, the caller's deadline) ran out, not the
+                    # host: release a half-open probe without counting a failure.
+                    breaker.probing = False
+                    retry_stats["localTimeouts"] += 1
+                else:
+                    breaker.record(False)
+                if not retryable or attempt >= self.retries:
+                    raise
+            except BaseException:
+                breaker.probing = False  # e.g. cancelled: let the next request probe
+                raise
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                breaker.record(not failed)
+                if not failed or not retryable or attempt >= self.retries:
+                    return response
+                await response.aclose()
+            attempt += 1
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            left  = time_left()
+            if left is not None and delay >= left:
+                retry_stats["deadlineExceeded"] += 1
+                return httpx.Response(504, text="Upstream deadline exceeded", request=request)
+            retry_stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def upstream_state() -> dict:
+    return {
+        "breakers": {netloc: b.as_dict() for netloc, b in breakers.items()},
+        **retry_stats,
+    }